@@ -19,7 +19,7 @@ setup(
     ],
     packages=find_packages(),
     install_requires=install_requires,
-    extras_require={},
+    extras_require={'parquet': ['pyarrow']},
     data_files=[],
     entry_points={
         'console_scripts': ['video_annotation_tool=video_annotation_tool.video_annotation_tool:main'],
@@ -0,0 +1,97 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from video_annotation_tool import annotation_export
+from video_annotation_tool.annotation_export import export_annotations
+
+
+def write_annotation(path, video_annotations, **extra):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(dict(video_annotations=video_annotations, **extra), f)
+
+
+@pytest.fixture
+def annotations(tmp_path):
+    folder = tmp_path / 'annotations'
+    write_annotation(str(folder / 'a' / 'clip01.json'), {'1': {'frame': 10, 'time': 0.4}, '2': {'frame': 20, 'time': 0.8}})
+    write_annotation(str(folder / 'b' / 'clip01.json'), {'1': {'frame': 30, 'time': 1.2}})
+    return folder
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    loaded = []
+    load = annotation_export.load_annotation_rows
+
+    def counting_load(json_path, name=None):
+        loaded.append(name)
+        return load(json_path, name)
+    monkeypatch.setattr(annotation_export, 'load_annotation_rows', counting_load)
+    return loaded
+
+
+def touch_later(path):
+    mtime = os.path.getmtime(path) + 10
+    os.utime(path, (mtime, mtime))
+
+
+def test_export_reloads_only_changed_files(annotations, tmp_path, loads):
+    output = str(tmp_path / 'export.csv')
+    a, b = os.path.join('a', 'clip01.json'), os.path.join('b', 'clip01.json')
+
+    export_annotations(str(annotations), output, workers=1)
+    assert sorted(loads) == [a, b]
+    assert len(pd.read_csv(output)) == 3
+
+    # Unchanged files are taken from the cache
+    loads.clear()
+    export_annotations(str(annotations), output, workers=1)
+    assert loads == []
+
+    # A changed file is read again
+    write_annotation(str(annotations / 'b' / 'clip01.json'), {'1': {'frame': 31, 'time': 1.24}, '4': {'frame': 90, 'time': 3.6}})
+    touch_later(str(annotations / 'b' / 'clip01.json'))
+    export_annotations(str(annotations), output, workers=1)
+    assert loads == [b]
+    df = pd.read_csv(output)
+    assert df[df['annotation_file'] == b]['frame'].tolist() == [31, 90]
+    assert df[df['annotation_file'] == a]['frame'].tolist() == [10, 20]
+
+    # Rows of a deleted file are dropped without reading the others again
+    loads.clear()
+    os.remove(str(annotations / 'a' / 'clip01.json'))
+    export_annotations(str(annotations), output, workers=1)
+    assert loads == []
+    assert pd.read_csv(output)['annotation_file'].unique().tolist() == [b]
+
+
+def test_export_npz_with_camera_columns(tmp_path):
+    folder = tmp_path / 'annotations'
+    frames = {'clip_cam1.mp4': 10, 'clip_cam2.mp4': 12}
+    write_annotation(str(folder / 'clip.json'),
+                     {'1': {'frame': 10, 'time': 0.4, 'frames': frames}, '2': {'frame': None, 'time': None}},
+                     audio_annotations={'1': {'time': 0.4, 'sample': 17640}})
+    write_annotation(str(folder / 'single.json'), {'3': {'frame': 5, 'time': 0.2}})
+    output = str(tmp_path / 'export.npz')
+    export_annotations(str(folder), output, workers=1)
+
+    with np.load(output) as data:
+        assert data['annotation_file'].tolist() == ['clip.json', 'clip.json', 'single.json']
+        assert data['event'].tolist() == [1, 2, 3]
+        assert data['frame'].tolist() == [10, -1, 5]
+        assert np.isnan(data['time'][1])
+        assert data['sample'].tolist() == [17640, -1, -1]
+        assert data['camera1_video'].tolist() == ['clip_cam1.mp4', '', '']
+        assert data['camera2_frame'].tolist() == [12, -1, -1]
+
+
+def test_parquet_without_engine_fails_before_loading(annotations, tmp_path, loads, monkeypatch):
+    monkeypatch.setattr(annotation_export.importlib.util, 'find_spec', lambda name: None)
+    with pytest.raises(ValueError, match='pyarrow'):
+        export_annotations(str(annotations), str(tmp_path / 'export.parquet'), workers=1)
+    assert loads == []
@@ -0,0 +1,83 @@
+import json
+import os
+
+import pytest
+
+from video_annotation_tool.annotation_files import (
+    build_annotation_index, get_derived_folder, get_json_path, get_proxy_path, index_files, list_videos, match_file,
+    missing_events, scan_files,
+)
+
+
+def touch(path, content=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+@pytest.fixture
+def recordings(tmp_path):
+    for name in ('top.mp4', 'b/clip01.mp4', 'a/clip01.mp4', 'a/clip02_cam1.mp4', 'a/clip02_cam2.mp4', 'a/notes.txt',
+                 '.hidden/clip.mp4', 'a/.clip03.mp4'):
+        touch(str(tmp_path / 'videos' / name))
+    for name in ('a/clip01.wav', 'b/clip01.wav', 'clip02_cam1.wav'):
+        touch(str(tmp_path / 'audio' / name))
+    return tmp_path
+
+
+def test_scan_files_lists_folders_in_name_order(recordings):
+    root = str(recordings / 'videos')
+    paths = [os.path.relpath(entry.path, root) for entry in scan_files(root, ('.mp4',))]
+    assert paths == ['top.mp4', os.path.join('a', 'clip01.mp4'), os.path.join('a', 'clip02_cam1.mp4'),
+                     os.path.join('a', 'clip02_cam2.mp4'), os.path.join('b', 'clip01.mp4')]
+
+
+def test_list_videos_streams_relative_paths(recordings):
+    videos = list_videos(str(recordings / 'videos'))
+    assert next(videos) == 'top.mp4'
+    assert next(videos) == os.path.join('a', 'clip01.mp4')
+
+
+def test_files_are_matched_by_relative_path_only(recordings):
+    audio_files = index_files(str(recordings / 'audio'), ('.wav',))
+    assert match_file(audio_files, os.path.join('a', 'clip01.mp4')) == str(recordings / 'audio' / 'a' / 'clip01.wav')
+    assert match_file(audio_files, os.path.join('b', 'clip01.mp4')) == str(recordings / 'audio' / 'b' / 'clip01.wav')
+    # A file with the same name in another folder is not a match
+    assert match_file(audio_files, os.path.join('a', 'clip02_cam1.mp4')) is None
+    assert index_files(None, ('.wav',)) == {}
+
+
+def test_derived_folders_mirror_the_video_subfolders(tmp_path):
+    root = str(tmp_path / 'videos')
+    assert get_derived_folder(None, root, 'annotations') == str(tmp_path / 'annotations')
+    assert get_derived_folder(os.path.join(root, 'top.mp4'), root, 'motion') == str(tmp_path / 'motion')
+    assert get_derived_folder(os.path.join(root, 'a', 'x', 'clip.mp4'), root, 'proxies') == str(tmp_path / 'proxies' / 'a' / 'x')
+    # Without a root, the video's own folder is the root
+    assert get_derived_folder(os.path.join(root, 'clip.mp4'), None, 'candidates') == str(tmp_path / 'candidates')
+
+
+def test_equally_named_videos_in_different_subfolders_do_not_collide(tmp_path):
+    root = str(tmp_path / 'videos')
+    a, b = os.path.join(root, 'a', 'clip01.mp4'), os.path.join(root, 'b', 'clip01.mp4')
+    assert get_json_path(a, root) != get_json_path(b, root)
+    assert get_proxy_path(a, root) != get_proxy_path(b, root)
+    # cam1 and cam2 share one annotation file
+    assert get_json_path(os.path.join(root, 'a', 'clip02_cam1.mp4'), root) == \
+        get_json_path(os.path.join(root, 'a', 'clip02_cam2.mp4'), root) == str(tmp_path / 'annotations' / 'a' / 'clip02.json')
+
+
+def test_annotation_index_reports_missing_events(tmp_path):
+    annotations = tmp_path / 'annotations'
+    complete = {str(e): {'frame': e, 'time': e / 30.0} for e in range(1, 5)}
+    touch(str(annotations / 'a' / 'clip01.json'), json.dumps({'video_annotations': complete}))
+    partial = {'1': {'frame': 1, 'time': 0.1}, '4': {'frame': None, 'time': None}}
+    touch(str(annotations / 'b' / 'clip01.json'), json.dumps({'video_annotations': partial}))
+    touch(str(annotations / 'broken.json'), '{')
+
+    index = build_annotation_index(str(annotations))
+    assert set(index) == {os.path.join('a', 'clip01.json'), os.path.join('b', 'clip01.json')}
+    assert missing_events(index, os.path.join('a', 'clip01.mp4')) == []
+    assert missing_events(index, os.path.join('b', 'clip01.mp4')) == ['2', '3', '4']
+    assert missing_events(index, os.path.join('b', 'clip01.mp4'), ['1']) == []
+    assert missing_events(index, 'clip01.mp4') == ['1', '2', '3', '4']
+    assert build_annotation_index(str(tmp_path / 'missing')) == {}
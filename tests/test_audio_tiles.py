@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from video_annotation_tool.audio_tiles import AudioTileCache
+
+
+@pytest.fixture
+def tiles():
+    rng = np.random.default_rng(0)
+    signal = rng.uniform(-1, 1, size=(2, 20000))
+    cache = AudioTileCache(signal, 8000, view_width=200, height=64, workers=1)
+    yield cache
+    cache.close()
+
+
+def test_signal_is_not_copied():
+    signal = np.zeros((1, 1000), dtype=np.float64)
+    cache = AudioTileCache(signal, 8000, view_width=100, height=32, workers=1)
+    assert np.shares_memory(cache._signal, signal)
+    cache.close()
+
+
+def test_power_frames_zero_pad_the_edges(tiles):
+    nfft = 512
+    centers = np.array([0, 100, 256, 10000, 19800, 19999], dtype=np.int64)
+    padded = np.pad(tiles._signal[1].astype(np.float32), (nfft, nfft))
+    idx = centers[:, None] + np.arange(-nfft // 2, nfft // 2)[None, :] + nfft
+    expected = np.abs(np.fft.rfft(padded[idx] * np.hanning(nfft).astype(np.float32), axis=1)) ** 2
+    np.testing.assert_allclose(tiles._power_frames(centers, 1), expected, rtol=1e-4, atol=1e-6)
+
+
+def test_tiles_cover_the_end_of_the_signal(tiles):
+    level = tiles.max_level
+    last = int(np.ceil(20000 / tiles.samples_per_column(level))) // tiles._tile_width
+    for mode in (0, 1):
+        tiles._render_tile((mode, level, last, 0))
+        assert tiles._tiles[(mode, level, last, 0)].shape == (64, tiles._tile_width, 3)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from video_annotation_tool.av_sync import cross_correlation_lag, estimate_offset_and_drift
+
+
+SR = 8000
+
+
+def _clicks(duration, seed):
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.uniform(0.0, duration, size=int(duration * 2)))
+
+
+def _render(times, clicks, seed):
+    # Noise modulated by short bursts at the click times, as seen in the video time base
+    rng = np.random.default_rng(seed)
+    env = np.full(len(times), 0.02)
+    for c in clicks:
+        env += np.exp(-0.5 * ((times - c) / 0.02) ** 2)
+    return (env * rng.standard_normal(len(times))).astype(np.float32)
+
+
+def _recordings(offset, drift=0.0, duration=40.0):
+    clicks = _clicks(duration + 10.0, seed=1)
+    video_times = np.arange(int(duration * SR)) / SR
+    wav_times = np.arange(int(duration * SR)) / SR
+    video_audio = _render(video_times, clicks, seed=2)
+    # wav_time = video_time * (1 + drift) + offset
+    wav = _render((wav_times - offset) / (1.0 + drift), clicks, seed=3)
+    return video_audio, wav[None, :]
+
+
+@pytest.mark.parametrize("offset", [-2.0, -0.8, -0.55, -0.2, 0.0, 0.45, 1.5])
+def test_offset_is_recovered(offset):
+    video_audio, wav = _recordings(offset)
+    sync = estimate_offset_and_drift(video_audio, SR, wav, SR)
+    assert sync is not None
+    assert sync["offset"] == pytest.approx(offset, abs=0.01)
+    assert abs(sync["drift"]) < 5e-4
+
+
+def test_small_drift_is_not_rejected():
+    video_audio, wav = _recordings(0.3, drift=1e-3, duration=120.0)
+    sync = estimate_offset_and_drift(video_audio, SR, wav, SR)
+    assert sync["score"] >= 0.3
+    assert sync["offset"] == pytest.approx(0.3, abs=0.01)
+    assert sync["drift"] == pytest.approx(1e-3, abs=2e-4)
+
+
+def test_empty_lag_range_does_not_raise():
+    assert cross_correlation_lag(np.ones(10), np.ones(10), -5) == (0, 0.0)
+    assert cross_correlation_lag(np.ones(10), np.ones(10), 2, center=100) == (0, 0.0)
@@ -0,0 +1,16 @@
+import numpy as np
+
+from video_annotation_tool.event_candidates import audio_onset_candidates, detect_event_candidates
+
+
+def test_stationary_noise_gives_only_the_real_transients():
+    sr = 16000
+    rng = np.random.default_rng(0)
+    x = 0.05 * rng.standard_normal(10 * sr)
+    for t in (2.0, 5.0, 7.5):
+        i = int(t * sr)
+        x[i:i + 800] += 0.8 * rng.standard_normal(800) * np.exp(-np.arange(800) / 200.0)
+
+    times, _ = audio_onset_candidates(x, sr)
+    np.testing.assert_allclose(times, [2.0, 5.0, 7.5], atol=0.01)
+    assert len(detect_event_candidates(30, x, sr)) == 3
@@ -0,0 +1,102 @@
+import pytest
+
+from video_annotation_tool import input_events
+from video_annotation_tool.input_events import DisplayLog, InputEventQueue
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(input_events.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def keys(events):
+    return [(e.key, e.ctrl) for e in events]
+
+
+def test_window_key_uses_the_listener_press_time(clock):
+    queue = InputEventQueue()
+    queue.listener_press('1')
+    clock[0] += 0.3
+    queue.window_key('1')
+    events = queue.drain()
+    assert keys(events) == [('1', False)]
+    assert events[0].timestamp == 100.0
+    assert queue.drain() == []
+
+
+def test_plain_key_is_kept_when_ctrl_is_pressed_before_the_window_reports_it(clock):
+    queue = InputEventQueue()
+    queue.listener_press('1')
+    queue.set_ctrl(True)
+    clock[0] += 0.1
+    queue.listener_press('2')
+    clock[0] += 0.1
+    queue.window_key('1')
+    assert keys(queue.drain()) == [('1', False), ('2', True)]
+
+
+def test_ctrl_keys_are_queued_once_in_press_order(clock):
+    queue = InputEventQueue()
+    queue.set_ctrl(True)
+    queue.listener_press('3')
+    queue.set_ctrl(False)
+    clock[0] += 0.1
+    queue.listener_press('4')
+    clock[0] += 0.1
+    # The window reports both, the Ctrl one after Ctrl was released
+    queue.window_key('4')
+    queue.window_key('3')
+    assert keys(queue.drain()) == [('3', True), ('4', False)]
+
+
+def test_unmatched_window_key_while_ctrl_is_held_is_dropped(clock):
+    queue = InputEventQueue()
+    queue.listener_press('a')
+    queue.window_key('a')
+    queue.drain()
+    queue.set_ctrl(True)
+    queue.window_key('5')
+    assert queue.drain() == []
+
+
+def test_window_key_without_listener_gets_its_own_time(clock):
+    queue = InputEventQueue()
+    queue.window_key('d')
+    events = queue.drain()
+    assert keys(events) == [('d', False)]
+    assert events[0].timestamp == 100.0
+
+
+def test_listener_presses_expire(clock):
+    queue = InputEventQueue(confirm_window=1.0)
+    queue.listener_press('1')
+    clock[0] += 1.5
+    queue.window_key('2')
+    events = queue.drain()
+    assert keys(events) == [('2', False)]
+    assert events[0].timestamp == 101.5
+    # The expired press cannot be confirmed any more
+    queue.window_key('1')
+    assert queue.drain()[0].timestamp == 101.5
+
+
+def test_frame_at_returns_the_frame_on_screen():
+    log = DisplayLog()
+    assert log.frame_at(1.0) is None
+    log.shown(10, 1.0)
+    log.shown(11, 2.0)
+    log.shown(12, 3.0)
+    assert log.frame_at(0.5) == 10
+    assert log.frame_at(1.0) == 10
+    assert log.frame_at(2.5) == 11
+    assert log.frame_at(9.0) == 12
+
+
+def test_display_log_keeps_the_latest_frames():
+    log = DisplayLog(size=2)
+    for i in range(5):
+        log.shown(i, float(i))
+    assert log.frame_at(0.0) == 3
+    assert log.frame_at(4.0) == 4
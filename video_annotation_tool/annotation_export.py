@@ -0,0 +1,178 @@
+import importlib.util
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+
+EXPORT_FORMATS = ('.csv', '.parquet', '.npz')
+PARQUET_ENGINES = ('pyarrow', 'fastparquet')
+EXPORT_COLUMNS = ['annotation_file', 'video', 'event', 'frame', 'time', 'sample', 'order_valid']
+CACHE_VERSION = 2
+
+
+def check_event_order(video_annotations):
+    """Return the events annotated at an earlier frame than the previous event."""
+    problems = []
+    previous = None
+    for event in sorted(video_annotations, key=int):
+        frame = video_annotations[event].get('frame')
+        if frame is None:
+            continue
+        if previous is not None and frame < previous[1]:
+            problems.append(f"E{event} (frame {frame}) before E{previous[0]} (frame {previous[1]})")
+        previous = (event, frame)
+    return problems
+
+
+def load_annotation_rows(json_path, name=None):
+    """Read one annotation JSON into export rows, one per event. `name` is its path relative to the annotations folder."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    name = name or os.path.basename(json_path)
+    video = data.get('video_file', os.path.splitext(name)[0])
+    video_annotations = data.get('video_annotations', {})
+    audio_annotations = data.get('audio_annotations', {})
+
+    problems = check_event_order(video_annotations)
+    rows = []
+    for event in sorted(set(video_annotations) | set(audio_annotations), key=int):
+        v = video_annotations.get(event, {})
+        a = audio_annotations.get(event, {})
+        row = {
+            'annotation_file': name,
+            'video': video,
+            'event': int(event),
+            'frame': v.get('frame'),
+            'time': v.get('time', a.get('time')),
+            'sample': a.get('sample'),
+            'order_valid': not problems,
+        }
+        # Frames of every camera of a multi-camera annotation, in the order they were saved
+        for n, (camera_video, camera_frame) in enumerate(v.get('frames', {}).items(), 1):
+            row[f'camera{n}_video'] = camera_video
+            row[f'camera{n}_frame'] = camera_frame
+        rows.append(row)
+    return rows, problems
+
+
+def _load_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring export cache {cache_path}: {e}")
+        return {}
+    if cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache.get('files', {})
+
+
+def _camera_count(columns):
+    return sum(1 for column in columns if column.startswith('camera') and column.endswith('_video'))
+
+
+def _rows_to_frame(rows):
+    cameras = max((_camera_count(row) for row in rows), default=0)
+    camera_columns = [f'camera{n}_{key}' for n in range(1, cameras + 1) for key in ('video', 'frame')]
+    df = pd.DataFrame(rows, columns=EXPORT_COLUMNS + camera_columns)
+    dtypes = {
+        'annotation_file': 'string',
+        'video': 'category',
+        'event': 'int8',
+        'frame': 'Int64',
+        'time': 'float64',
+        'sample': 'Int64',
+        'order_valid': 'bool',
+    }
+    for n in range(1, cameras + 1):
+        dtypes[f'camera{n}_video'] = 'category'
+        dtypes[f'camera{n}_frame'] = 'Int64'
+    return df.astype(dtypes)
+
+
+def write_dataset(df, output_path):
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext == '.csv':
+        df.to_csv(output_path, index=False)
+    elif ext == '.parquet':
+        df.to_parquet(output_path, index=False)
+    elif ext == '.npz':
+        # Missing frames/samples are stored as -1, missing times as NaN and missing camera videos as ''
+        cameras = {}
+        for n in range(1, _camera_count(df.columns) + 1):
+            cameras[f'camera{n}_video'] = df[f'camera{n}_video'].astype('string').fillna('').to_numpy(dtype=str)
+            cameras[f'camera{n}_frame'] = df[f'camera{n}_frame'].fillna(-1).to_numpy(dtype=np.int64)
+        np.savez_compressed(
+            output_path,
+            annotation_file=df['annotation_file'].to_numpy(dtype=str),
+            video=df['video'].astype(str).to_numpy(dtype=str),
+            event=df['event'].to_numpy(dtype=np.int8),
+            frame=df['frame'].fillna(-1).to_numpy(dtype=np.int64),
+            time=df['time'].to_numpy(dtype=np.float64),
+            sample=df['sample'].fillna(-1).to_numpy(dtype=np.int64),
+            order_valid=df['order_valid'].to_numpy(dtype=bool),
+            **cameras,
+        )
+    else:
+        raise ValueError(f"Unsupported export format {ext!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+
+
+def export_annotations(annotations_folder, output_path, workers=None):
+    """Export all annotation JSON files into one table, reloading only files changed since the last export."""
+    if os.path.splitext(output_path)[1].lower() not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format for {output_path}, expected one of {', '.join(EXPORT_FORMATS)}")
+    # Fail before any file is read when pandas has no Parquet engine
+    if output_path.lower().endswith('.parquet') and not any(importlib.util.find_spec(e) for e in PARQUET_ENGINES):
+        raise ValueError(f"Writing {output_path} needs pyarrow (pip install pyarrow), or export to .csv or .npz")
+
+    cache_path = output_path + '.cache.json'
+    cached = _load_cache(cache_path) if os.path.exists(output_path) else {}
+
+    # Annotations of videos in subfolders are kept in the same subfolders of the annotations folder
+    current = {}
+    for folder, subfolders, filenames in os.walk(annotations_folder):
+        subfolders.sort()
+        for filename in filenames:
+            if filename.endswith('.json') and not filename.endswith('.cache.json'):
+                path = os.path.join(folder, filename)
+                current[os.path.relpath(path, annotations_folder)] = (path, os.path.getmtime(path))
+
+    files = {name: cached[name] for name, (_, mtime) in current.items()
+             if name in cached and cached[name]['mtime'] == mtime}
+    changed = [name for name in current if name not in files]
+
+    if not changed and len(files) == len(cached) and os.path.exists(output_path):
+        print(f"{output_path} is up to date ({len(files)} annotation files).")
+        return output_path
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda name: _load_safely(current[name][0], name), changed)
+        for name, (rows, problems, error) in zip(changed, results):
+            if error is not None:
+                print(f"Error reading {current[name][0]}: {error}")
+                continue
+            for problem in problems:
+                print(f"{name}: event order: {problem}")
+            files[name] = {'mtime': current[name][1], 'rows': rows}
+
+    rows = [row for name in sorted(files) for row in files[name]['rows']]
+    write_dataset(_rows_to_frame(rows), output_path)
+
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'files': files}, f)
+
+    print(f"Exported {len(rows)} events from {len(files)} annotation files to {output_path} ({len(changed)} reloaded).")
+    return output_path
+
+
+def _load_safely(json_path, name=None):
+    try:
+        rows, problems = load_annotation_rows(json_path, name)
+        return rows, problems, None
+    except (OSError, ValueError, KeyError) as e:
+        return [], [], e
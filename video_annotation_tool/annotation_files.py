@@ -0,0 +1,301 @@
+import json
+import os
+import subprocess
+import cv2
+import numpy as np
+import pandas as pd
+from scipy.io import wavfile
+from video_annotation_tool.av_sync import frame_to_sample
+from video_annotation_tool.event_candidates import detect_event_candidates
+
+VIDEO_EXTENSIONS = ('.mp4', '.webm')
+REQUIRED_EVENTS = ('1', '2', '3', '4')
+
+def read_wave(path):
+    sample_rate, x = wavfile.read(path)
+    x = x.T
+    if x.dtype == np.int32:
+        x = x / float(2**31-1)
+    elif x.dtype == np.int16:
+        x = x / float(2**15-1)
+    if len(x.shape) == 1:
+        x = x[None, :]
+    return sample_rate, x
+
+def load_velocity(labelled_positions_path):
+    df = pd.read_csv(labelled_positions_path)
+
+    # Required check because of legacy files
+    if 'velocity_cm/s' in df.columns:
+        df['velocity'] = df['velocity_cm/s']
+
+    velocity_original = df['velocity'].copy()
+    df['velocity'] = df['velocity'].rolling(window=3, center=True).mean()
+    df['velocity'] = df['velocity'].fillna(velocity_original)
+
+    frames = df['Frame'].to_numpy(dtype=np.int64)
+    velocities = df['velocity'].fillna(0).to_numpy(dtype=np.float32)
+    return frames, velocities
+
+def convert_video_to_h264(input_path):
+    
+    command_check = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        input_path
+    ]
+    result = subprocess.run(command_check, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    codec = result.stdout.decode().strip()
+    
+    if codec == "h264":
+        print(f"{input_path} is already H.264, skipping conversion.")
+        return input_path
+
+    temp_output = input_path + "_tmp.mp4"
+    command_convert = [
+        "ffmpeg", "-y",
+        "-i", input_path,
+        "-c:v", "libx264", "-preset", "slow", "-crf", "23",
+        "-c:a", "aac", "-b:a", "128k",
+        temp_output
+    ]
+    print(f"Converting: {input_path} → H.264")
+    result = subprocess.run(command_convert, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    if os.path.exists(temp_output):
+        os.replace(temp_output, input_path)
+        print(f"Conversion done: {input_path}")
+        return input_path
+    else:
+        print(f"Error converting {input_path}:\n{result.stderr.decode()}")
+        return input_path
+
+def get_json_filename(video_filename):
+    base_name = os.path.splitext(video_filename)[0]
+    base_name_lower = base_name.lower()
+
+    if "cam1" in base_name_lower:
+        base_name = base_name_lower.replace("cam1", "")
+    elif "cam2" in base_name_lower:
+        base_name = base_name_lower.replace("cam2", "")
+
+    base_name = base_name.strip(" _-")
+    return base_name + ".json"
+
+def get_derived_folder(video_path, video_root, name):
+    # Derived folders (annotations, candidates, ...) live next to the root video folder and mirror its subfolders,
+    # so equally named videos in different subfolders do not share files
+    if video_root is None:
+        return os.path.join(os.path.dirname(os.path.dirname(video_path)), name)
+    folder = os.path.join(os.path.dirname(os.path.normpath(video_root)), name)
+    if video_path is None:
+        return folder
+    subfolder = os.path.relpath(os.path.dirname(video_path), video_root)
+    return folder if subfolder == os.curdir else os.path.join(folder, subfolder)
+
+def get_annotations_folder(video_path, video_root=None):
+    return get_derived_folder(video_path, video_root, "annotations")
+
+def get_json_path(video_path, video_root=None):
+    return os.path.join(get_annotations_folder(video_path, video_root), get_json_filename(os.path.basename(video_path)))
+
+def get_json_key(video_file):
+    # Annotation file of a video relative to the annotations folder
+    return os.path.join(os.path.dirname(video_file), get_json_filename(os.path.basename(video_file)))
+
+def merge_annotations(video_path, new_annotations, audio_path, should_update_audio, camera_sync=None, video_root=None, audio_sync=None):
+    original_video_file = os.path.basename(video_path)
+    json_path = get_json_path(video_path, video_root)
+    annotations_folder = os.path.dirname(json_path)
+
+    existing_data = {}
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            existing_data = json.load(f)
+
+    existing_data["video_file"] = original_video_file
+    if camera_sync is not None:
+        existing_data["camera_sync"] = camera_sync
+    if should_update_audio:
+        existing_data['audio_file'] = os.path.basename(audio_path)
+        if audio_sync is not None:
+            existing_data['audio_sync'] = audio_sync
+        
+    if "video_annotations" not in existing_data:
+        existing_data["video_annotations"] = {}
+    if "audio_annotations" not in existing_data and should_update_audio:
+        existing_data["audio_annotations"] = {}
+
+    for k, v in new_annotations.items():
+        if v["frame"] is not None and v["time"] is not None:
+            existing_data["video_annotations"][k] = {"time": v["time"], "frame": v["frame"]}
+            if v.get("frames"):
+                existing_data["video_annotations"][k]["frames"] = v["frames"]
+
+        if v['sample'] is not None and should_update_audio:
+            existing_data["audio_annotations"][k] = {"time": v["time"], "sample": int(v["sample"])}
+
+    os.makedirs(annotations_folder, exist_ok=True)
+
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(existing_data, f, indent=4)
+        print(f"Annotations for {video_path} updated in {json_path}.")
+
+def get_candidates_path(video_path, video_root=None):
+    candidates_folder = get_derived_folder(video_path, video_root, "candidates")
+    return os.path.join(candidates_folder, os.path.splitext(os.path.basename(video_path))[0] + ".json")
+
+def get_proxy_path(video_path, video_root=None):
+    proxies_folder = get_derived_folder(video_path, video_root, "proxies")
+    return os.path.join(proxies_folder, os.path.splitext(os.path.basename(video_path))[0] + "_proxy.mp4")
+
+def get_motion_path(video_path, video_root=None):
+    motion_folder = get_derived_folder(video_path, video_root, "motion")
+    return os.path.join(motion_folder, os.path.splitext(os.path.basename(video_path))[0] + ".npz")
+
+def _source_mtimes(*paths):
+    return {os.path.basename(p): os.path.getmtime(p) for p in paths if p and os.path.exists(p)}
+
+def get_event_candidates(video_path, audio_path, labelled_position_path, fps=None, audio_sr=None, audio_data=None, video_root=None):
+    candidates_path = get_candidates_path(video_path, video_root)
+    sources = _source_mtimes(video_path, audio_path, labelled_position_path)
+
+    if os.path.exists(candidates_path):
+        try:
+            with open(candidates_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get("sources") == sources:
+                return cached["candidates"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring candidates cache {candidates_path}: {e}")
+
+    if fps is None:
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        cap.release()
+
+    if audio_data is None and audio_path and os.path.exists(audio_path):
+        try:
+            audio_sr, audio_data = read_wave(audio_path)
+        except Exception as e:
+            print(f"Error reading audio file {audio_path}: {e}")
+
+    frames = velocities = None
+    if labelled_position_path and os.path.exists(labelled_position_path):
+        frames, velocities = load_velocity(labelled_position_path)
+
+    candidates = detect_event_candidates(fps, audio_data, audio_sr, frames, velocities)
+
+    os.makedirs(os.path.dirname(candidates_path), exist_ok=True)
+    with open(candidates_path, 'w', encoding='utf-8') as f:
+        json.dump({"video_file": os.path.basename(video_path), "fps": fps, "sources": sources, "candidates": candidates}, f, indent=4)
+    return candidates
+
+def apply_audio_sync(annotations, audio_sr, audio_sync):
+    for v in annotations.values():
+        if v["time"] is not None:
+            v["sample"] = frame_to_sample(v["time"], audio_sr, audio_sync)
+
+def write_audio_sync(json_path, video_file, audio_file, audio_sr, audio_sync):
+    data = {}
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+    data.setdefault("video_file", video_file)
+    data["audio_file"] = audio_file
+    data["audio_sync"] = audio_sync
+
+    # Existing audio annotations are remapped from the video times with the new estimate
+    audio_annotations = {}
+    for k, v in data.get("video_annotations", {}).items():
+        if v.get("time") is not None:
+            audio_annotations[k] = {"time": v["time"], "sample": frame_to_sample(v["time"], audio_sr, audio_sync)}
+    if audio_annotations:
+        data["audio_annotations"] = audio_annotations
+
+    os.makedirs(os.path.dirname(json_path) or '.', exist_ok=True)
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+
+def save_video_annotations(video_path, annotations, audio_path, audio_sr, audio_sync, camera_sync=None, video_root=None):
+    should_update_audio = False
+    if audio_sr is not None and audio_sync is not None:
+        print(f"Audio offset {audio_sync['offset']:.4f}s, drift {audio_sync['drift']:.2e} ({audio_sync['method']})")
+        apply_audio_sync(annotations, audio_sr, audio_sync)
+        should_update_audio = True
+    elif audio_sr is not None:
+        print(f"No audio offset could be determined for {video_path}, audio annotations are not updated.")
+    merge_annotations(video_path, annotations, audio_path, should_update_audio, camera_sync, video_root, audio_sync)
+
+def update_annotations(annotations, event_number, annotation):
+    print(f"Event {event_number} annotated at frame {annotation[0]}, time {annotation[1]:.2f}s")
+    frame = annotation[0]
+    time = annotation[1]
+    sample = time * annotation[2] if annotation[2] is not None else None
+    annotations[str(event_number)] = {
+        "frame": frame,
+        "time": time,
+        "sample": sample
+    }
+
+def _sorted_entries(folder):
+    try:
+        with os.scandir(folder) as entries:
+            return sorted((entry for entry in entries if not entry.name.startswith('.')), key=lambda entry: entry.name)
+    except OSError as e:
+        print(f"Error scanning {folder}: {e}")
+        return []
+
+def scan_files(root, extensions):
+    # Streams matching entries from root and all its subfolders, one folder listing at a time. The files of a folder
+    # come before its subfolders, both in name order
+    folders = [root]
+    while folders:
+        subfolders = []
+        for entry in _sorted_entries(folders.pop()):
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.path)
+            elif entry.name.lower().endswith(extensions):
+                yield entry
+        folders.extend(reversed(subfolders))
+
+def list_videos(video_path):
+    # Paths relative to video_path, so subfolders are kept
+    for entry in scan_files(video_path, VIDEO_EXTENSIONS):
+        yield os.path.relpath(entry.path, video_path)
+
+def index_files(root, extensions):
+    # Keyed by the path relative to root without extension, matching the video's path relative to its root
+    index = {}
+    if not root:
+        return index
+    for entry in scan_files(root, extensions):
+        index[os.path.splitext(os.path.relpath(entry.path, root))[0]] = entry.path
+    return index
+
+def match_file(index, video_file):
+    return index.get(os.path.splitext(video_file)[0])
+
+def build_annotation_index(annotations_folder):
+    # Annotated events per JSON file relative to the annotations folder, reading the folder once
+    index = {}
+    if not os.path.isdir(annotations_folder):
+        return index
+    for entry in scan_files(annotations_folder, ('.json',)):
+        try:
+            with open(entry.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading {entry.path}: {e}")
+            continue
+        key = os.path.relpath(entry.path, annotations_folder)
+        index[key] = {k for k, v in data.get("video_annotations", {}).items() if v.get("frame") is not None}
+    return index
+
+def missing_events(annotation_index, video_file, events=REQUIRED_EVENTS):
+    annotated = annotation_index.get(get_json_key(video_file), set())
+    return [event for event in events if event not in annotated]
@@ -0,0 +1,754 @@
+import io
+import ipaddress
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import cv2
+import numpy as np
+from scipy.io import wavfile
+
+from video_annotation_tool.audio_tiles import AudioTileCache
+from video_annotation_tool.av_sync import estimate_av_sync
+from video_annotation_tool.annotation_files import (
+    REQUIRED_EVENTS, build_annotation_index, convert_video_to_h264, get_annotations_folder, get_event_candidates,
+    get_json_path, index_files, list_videos, match_file, missing_events, read_wave, save_video_annotations,
+    update_annotations,
+)
+from video_annotation_tool.panels import (
+    build_channel_panels, build_spectrogram_image, build_velocity_image, build_waveform_image, get_zoomed_frame,
+)
+from video_annotation_tool.video_stream import VideoStream
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+JPEG_QUALITY = 85
+PREFETCH_FRAMES = 8
+FRAME_CACHE_SIZE = 256
+MAX_OPEN_VIDEOS = 2
+PANEL_WIDTH = 1280
+PANEL_HEIGHT = 140
+
+
+def _encode_png(img):
+    ok, buf = cv2.imencode('.png', img)
+    return buf.tobytes() if ok else None
+
+
+class VideoSession:
+    """Decoded video, audio and panels of one video, shared by all requests for it."""
+
+    def __init__(self, video_path, audio_path, labelled_position_path, video_root, encoder):
+        self.video_path = video_path
+        self.audio_path = audio_path
+        self.labelled_position_path = labelled_position_path
+        self.video_root = video_root
+        self._encoder = encoder
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()
+        self._encoding = set()
+        self._closed = False
+        self._images = {}
+
+        self.mp4_path = convert_video_to_h264(video_path)
+        self.stream = VideoStream(self.mp4_path)
+        if not self.stream.is_opened():
+            raise IOError(f"Could not open video {video_path}")
+
+        self.audio_sr = None
+        self.audio_data = None
+        if audio_path and os.path.exists(audio_path):
+            try:
+                self.audio_sr, self.audio_data = read_wave(audio_path)
+            except Exception as e:
+                print(f"Error reading audio file {audio_path}: {e}")
+
+        self.audio_sync = None
+        existing = self.read_existing()
+        if audio_path and existing.get("audio_file") == os.path.basename(audio_path):
+            self.audio_sync = existing.get("audio_sync")
+
+        self.candidates = get_event_candidates(video_path, audio_path, labelled_position_path, self.stream.fps,
+                                               self.audio_sr, self.audio_data, video_root)
+        self.tiles = None
+        if self.audio_data is not None:
+            self.tiles = AudioTileCache(self.audio_data, self.audio_sr, PANEL_WIDTH, PANEL_HEIGHT)
+        self._channel_panels = None
+
+    @property
+    def json_path(self):
+        return get_json_path(self.video_path, self.video_root)
+
+    def read_existing(self):
+        if not os.path.exists(self.json_path):
+            return {}
+        with open(self.json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def info(self):
+        return {
+            'video_file': os.path.basename(self.video_path),
+            'fps': self.stream.fps,
+            'frame_count': self.stream.frame_count,
+            'width': self.stream.size[0],
+            'height': self.stream.size[1],
+            'channels': 0 if self.audio_data is None else int(self.audio_data.shape[0]),
+            'audio_duration': 0.0 if self.audio_data is None else self.audio_data.shape[1] / float(self.audio_sr),
+            'audio_zoom_levels': 0 if self.tiles is None else self.tiles.max_level,
+            'has_velocity': bool(self.labelled_position_path and os.path.exists(self.labelled_position_path)),
+            'annotations': self.read_existing().get('video_annotations', {}),
+            'candidates': self.candidates,
+        }
+
+    def frame_jpeg(self, index, size, zoom, center, quality):
+        """Return frame `index` as JPEG and prefetch the frames around it at the same size."""
+        params = (size, zoom, center, quality)
+        future = self._submit((index,) + params)
+        around = list(range(index + 1, index + PREFETCH_FRAMES + 1)) + list(range(index - 1, index - PREFETCH_FRAMES // 2 - 1, -1))
+        for i in around:
+            if 0 <= i < self.stream.frame_count:
+                self._submit((i,) + params)
+        try:
+            return future.result()
+        except CancelledError:
+            # The video was closed meanwhile
+            return None
+
+    def _submit(self, key):
+        with self._lock:
+            future = self._frames.get(key)
+            if future is not None:
+                self._frames.move_to_end(key)
+                return future
+            if self._closed:
+                future = Future()
+                future.set_result(None)
+                return future
+            future = self._encoder.submit(self._encode, key)
+            # Tracked until done, also after it drops out of the frame cache, so close() can wait for it
+            self._encoding.add(future)
+            self._frames[key] = future
+            while len(self._frames) > FRAME_CACHE_SIZE:
+                self._frames.popitem(last=False)
+        future.add_done_callback(self._encoded)
+        return future
+
+    def _encoded(self, future):
+        with self._lock:
+            self._encoding.discard(future)
+
+    def _encode(self, key):
+        index, size, zoom, center, quality = key
+        frame = self.stream.get(index)
+        if frame is None:
+            return None
+        img = get_zoomed_frame(frame, zoom, center, size)
+        ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buf.tobytes() if ok else None
+
+    def panel_png(self, kind, channel):
+        key = (kind, channel)
+        with self._lock:
+            if key in self._images:
+                return self._images[key]
+
+        if kind == 'velocity':
+            img = build_velocity_image(self.labelled_position_path, PANEL_WIDTH, PANEL_HEIGHT,
+                                       total_frames=self.stream.frame_count)
+        elif self.audio_data is None:
+            if kind == 'waveform':
+                img = build_waveform_image(None, None, PANEL_WIDTH, PANEL_HEIGHT, 0)
+            else:
+                img = build_spectrogram_image(None, None, PANEL_WIDTH, PANEL_HEIGHT, 0)
+        else:
+            # Built outside the lock so frame requests are not blocked, a concurrent build is discarded
+            with self._lock:
+                panels = self._channel_panels
+            if panels is None:
+                panels = build_channel_panels(self.audio_data, self.audio_sr, PANEL_WIDTH, PANEL_HEIGHT)
+                with self._lock:
+                    if self._channel_panels is None:
+                        self._channel_panels = panels
+                    panels = self._channel_panels
+            channel = max(0, min(channel, len(panels) - 1))
+            img = panels[channel][kind]
+
+        data = _encode_png(img)
+        with self._lock:
+            self._images[key] = data
+        return data
+
+    def audio_view_png(self, center_time, level, mode, channel):
+        img, start, duration = self.tiles.render_view(center_time, level, mode, channel)
+        return _encode_png(img), start, duration
+
+    def audio_wav(self, channel):
+        key = ('wav', channel)
+        with self._lock:
+            if key in self._images:
+                return self._images[key]
+        channel = max(0, min(channel, self.audio_data.shape[0] - 1))
+        pcm = (np.clip(self.audio_data[channel], -1.0, 1.0) * (2 ** 15 - 1)).astype(np.int16)
+        buf = io.BytesIO()
+        wavfile.write(buf, self.audio_sr, pcm)
+        data = buf.getvalue()
+        with self._lock:
+            self._images[key] = data
+        return data
+
+    def save(self, events):
+        annotations = {}
+        for k in sorted(events, key=int):
+            v = events[k]
+            if v.get('frame') is not None and v.get('time') is not None:
+                update_annotations(annotations, int(k), (int(v['frame']), float(v['time']), self.audio_sr))
+        if not annotations:
+            return self.read_existing().get('video_annotations', {})
+
+        if self.audio_data is not None and self.audio_sync is None:
+            # Video annotations are saved even if the audio offset cannot be measured
+            try:
+                self.audio_sync = estimate_av_sync(self.mp4_path, self.audio_data, self.audio_sr,
+                                                   self.stream.fps, self.stream.frame_count)
+            except Exception as e:
+                print(f"Error estimating audio offset for {self.video_path}: {e}")
+        save_video_annotations(self.video_path, annotations, self.audio_path, self.audio_sr, self.audio_sync,
+                               video_root=self.video_root)
+        return self.read_existing().get('video_annotations', {})
+
+    def close(self):
+        # Prefetches that have not started are cancelled, running ones finish before the stream is closed
+        with self._lock:
+            self._closed = True
+            encoding = list(self._encoding)
+            self._frames.clear()
+        for future in encoding:
+            future.cancel()
+        wait(encoding)
+        self.stream.close()
+        if self.tiles is not None:
+            self.tiles.close()
+
+
+def _close_session(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+class AnnotationApp:
+    """Videos of a folder served to the browser client, with at most a few decoded at once."""
+
+    def __init__(self, video_path, audio_path, labelled_position_path, workers=None):
+        self.video_path = video_path
+        self.videos = list(list_videos(video_path))
+        self._audio_files = index_files(audio_path, ('.wav',))
+        self._csv_files = index_files(labelled_position_path, ('.csv',))
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.encoder = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jpeg')
+
+    def video_list(self):
+        annotation_index = build_annotation_index(get_annotations_folder(None, self.video_path))
+        return [{'index': i, 'video_file': video_file, 'missing': missing_events(annotation_index, video_file, REQUIRED_EVENTS)}
+                for i, video_file in enumerate(self.videos)]
+
+    def session(self, index):
+        # Sessions are opened outside the lock, so requests for other videos are not blocked meanwhile. The future
+        # is shared by concurrent requests for the same video
+        video_file = self.videos[index]
+        evicted = []
+        with self._lock:
+            future = self._sessions.get(index)
+            if future is not None:
+                self._sessions.move_to_end(index)
+                opening = False
+            else:
+                future = Future()
+                self._sessions[index] = future
+                opening = True
+                while len(self._sessions) > MAX_OPEN_VIDEOS:
+                    evicted.append(self._sessions.popitem(last=False)[1])
+
+        for old in evicted:
+            # Closed once it is open, which is immediately unless it is still being opened
+            old.add_done_callback(_close_session)
+        if opening:
+            try:
+                future.set_result(VideoSession(os.path.join(self.video_path, video_file),
+                                               match_file(self._audio_files, video_file),
+                                               match_file(self._csv_files, video_file),
+                                               self.video_path, self.encoder))
+            except Exception as e:
+                future.set_exception(e)
+                with self._lock:
+                    if self._sessions.get(index) is future:
+                        del self._sessions[index]
+        return future.result()
+
+    def close(self):
+        with self._lock:
+            futures = list(self._sessions.values())
+            self._sessions.clear()
+        self.encoder.shutdown(wait=False, cancel_futures=True)
+        for future in futures:
+            future.add_done_callback(_close_session)
+
+
+class AnnotationRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    routes = [
+        (re.compile(r'^/$'), 'page'),
+        (re.compile(r'^/api/videos$'), 'videos'),
+        (re.compile(r'^/api/videos/(\d+)$'), 'info'),
+        (re.compile(r'^/api/videos/(\d+)/frames/(\d+)\.jpg$'), 'frame'),
+        (re.compile(r'^/api/videos/(\d+)/panels/(waveform|spectrogram|velocity)\.png$'), 'panel'),
+        (re.compile(r'^/api/videos/(\d+)/audio-view\.png$'), 'audio_view'),
+        (re.compile(r'^/api/videos/(\d+)/audio\.wav$'), 'audio'),
+        (re.compile(r'^/api/videos/(\d+)/annotations$'), 'annotations'),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status=200):
+        self._send(status, json.dumps(data).encode('utf-8'), 'application/json')
+
+    def _is_same_origin(self):
+        # Only pages loaded from the bound address may use the API: the Host header guards against DNS rebinding,
+        # the Origin header against requests sent by other sites. localhost is accepted on a loopback address
+        host, port = self.server.server_address[:2]
+        addresses = {f'{host}:{port}'}
+        if ipaddress.ip_address(host).is_loopback:
+            addresses.add(f'localhost:{port}')
+        origin = self.headers.get('Origin')
+        return self.headers.get('Host') in addresses and (origin is None or origin in {f'http://{a}' for a in addresses})
+
+    def _dispatch(self, method):
+        if not self._is_same_origin():
+            self._send_json({'error': 'forbidden'}, 403)
+            return
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        for pattern, name in self.routes:
+            match = pattern.match(url.path)
+            if match:
+                handler = getattr(self, f'{method}_{name}', None)
+                if handler is None:
+                    self._send_json({'error': 'method not allowed'}, 405)
+                    return
+                try:
+                    handler(query, *match.groups())
+                except (IndexError, ValueError) as e:
+                    self._send_json({'error': str(e)}, 400)
+                except Exception as e:
+                    print(f"Error handling {self.path}: {e}")
+                    self._send_json({'error': str(e)}, 500)
+                return
+        self._send_json({'error': 'not found'}, 404)
+
+    def do_GET(self):
+        self._dispatch('get')
+
+    def do_POST(self):
+        self._dispatch('post')
+
+    def get_page(self, query):
+        self._send(200, CLIENT_PAGE.encode('utf-8'), 'text/html; charset=utf-8')
+
+    def get_videos(self, query):
+        self._send_json(self.server.app.video_list())
+
+    def get_info(self, query, index):
+        self._send_json(self.server.app.session(int(index)).info())
+
+    def get_frame(self, query, index, frame_index):
+        session = self.server.app.session(int(index))
+        src_w, src_h = session.stream.size
+        width = max(16, min(src_w, int(query.get('w', src_w))))
+        height = max(16, int(round(width * src_h / float(src_w))))
+        zoom = max(1.0, min(5.0, round(float(query.get('zoom', 1.0)), 1)))
+        center = None
+        if zoom > 1.0 and 'cx' in query and 'cy' in query:
+            center = (int(query['cx']), int(query['cy']))
+        quality = max(10, min(100, int(query.get('q', JPEG_QUALITY))))
+        data = session.frame_jpeg(int(frame_index), (width, height), zoom, center, quality)
+        if data is None:
+            self._send_json({'error': 'frame not available'}, 404)
+        else:
+            self._send(200, data, 'image/jpeg')
+
+    def get_panel(self, query, index, kind):
+        data = self.server.app.session(int(index)).panel_png(kind, int(query.get('channel', 0)))
+        self._send(200, data, 'image/png')
+
+    def get_audio_view(self, query, index):
+        session = self.server.app.session(int(index))
+        if session.tiles is None:
+            self._send_json({'error': 'no audio data'}, 404)
+            return
+        data, start, duration = session.audio_view_png(float(query.get('t', 0.0)), int(query.get('level', 1)),
+                                                       int(query.get('mode', 1)), int(query.get('channel', 0)))
+        self._send(200, data, 'image/png', {'X-View-Start': f'{start:.6f}', 'X-View-Duration': f'{duration:.6f}'})
+
+    def get_audio(self, query, index):
+        session = self.server.app.session(int(index))
+        if session.audio_data is None:
+            self._send_json({'error': 'no audio data'}, 404)
+            return
+        self._send(200, session.audio_wav(int(query.get('channel', 0))), 'audio/wav')
+
+    def post_annotations(self, query, index):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+        saved = self.server.app.session(int(index)).save(body.get('annotations', {}))
+        self._send_json({'annotations': saved})
+
+
+def serve_folder(video_path, audio_path, labelled_position_path, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None):
+    app = AnnotationApp(video_path, audio_path, labelled_position_path, workers)
+    server = ThreadingHTTPServer((host, port), AnnotationRequestHandler)
+    server.daemon_threads = True
+    server.app = app
+    print(f"Serving {len(app.videos)} videos on http://{host}:{port}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        app.close()
+
+
+CLIENT_PAGE = r"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Video Annotation</title>
+<style>
+  body { margin: 0; background: #181818; color: #ebebeb; font: 13px sans-serif; }
+  #title { padding: 6px 10px; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }
+  #main { display: flex; flex-direction: column; align-items: center; }
+  #frame { display: block; background: #000; }
+  #controls { display: flex; align-items: center; gap: 10px; padding: 6px 10px; background: #242424; box-sizing: border-box; }
+  #controls button { background: #303030; color: #ebebeb; border: 1px solid #696969; padding: 3px 10px; cursor: pointer; }
+  #controls button.selected { background: #be7d46; }
+  #speed { flex: 1; }
+  canvas { display: block; }
+</style>
+</head>
+<body>
+<div id="title"></div>
+<div id="main">
+  <img id="frame" alt="">
+  <div id="controls">
+    <select id="video"></select>
+    <button id="wave">Wave</button><button id="spec">Spec</button>
+    <span id="speedLabel">Speed 100%</span><input id="speed" type="range" min="1" max="100" value="100">
+    <button id="save">Save</button>
+  </div>
+  <canvas id="audioPanel"></canvas>
+  <canvas id="velocityPanel"></canvas>
+</div>
+<audio id="audio" preload="auto"></audio>
+<script>
+"use strict";
+const $ = id => document.getElementById(id);
+const CANDIDATE_COLORS = {audio: 'rgb(80,220,80)', velocity: 'rgb(0,160,255)'};
+const S = {videos: [], vi: 0, info: null, cur: 0, paused: false, speed: 100, mode: 1, channel: 0,
+           zoom: 1, center: null, audioZoom: 0, snap: false, events: {}, panels: {}, view: null,
+           loading: false, playStart: null, error: null};
+
+function api(path) { return `/api/videos/${S.vi}${path}`; }
+function fps() { return S.info ? S.info.fps : 30; }
+function frameWidth() {
+  const maxW = Math.min(window.innerWidth - 20, 1600, S.info.width);
+  const maxH = window.innerHeight - 2 * 140 - 90;
+  return Math.max(16, Math.round(Math.min(maxW, maxH * S.info.width / S.info.height)));
+}
+
+function loadImage(url) {
+  return new Promise((resolve, reject) => { const img = new Image(); img.onload = () => resolve(img); img.onerror = reject; img.src = url; });
+}
+
+async function loadVideo(vi) {
+  S.vi = Math.max(0, Math.min(vi, S.videos.length - 1));
+  $('video').value = S.vi;
+  S.info = await (await fetch(api(''))).json();
+  S.cur = 0; S.events = {}; S.zoom = 1; S.center = null; S.audioZoom = 0; S.view = null;
+  S.channel = Math.min(S.channel, Math.max(0, S.info.channels - 1));
+  await loadPanels();
+  if (S.info.channels) { $('audio').src = api(`/audio.wav?channel=${S.channel}`); }
+  else { $('audio').removeAttribute('src'); }
+  setPaused(false);
+  showFrame();
+}
+
+async function loadPanels() {
+  const c = S.channel;
+  const [w, s, v] = await Promise.all([
+    loadImage(api(`/panels/waveform.png?channel=${c}`)),
+    loadImage(api(`/panels/spectrogram.png?channel=${c}`)),
+    loadImage(api('/panels/velocity.png'))]);
+  S.panels = {waveform: w, spectrogram: s, velocity: v};
+}
+
+function frameUrl(i) {
+  let url = api(`/frames/${i}.jpg?w=${frameWidth()}`);
+  if (S.zoom > 1 && S.center) url += `&zoom=${S.zoom.toFixed(1)}&cx=${S.center[0]}&cy=${S.center[1]}`;
+  return url;
+}
+
+function showFrame() {
+  if (S.loading) return;
+  S.loading = true;
+  const i = S.cur;
+  loadImage(frameUrl(i)).then(img => {
+    $('frame').src = img.src;
+    S.shown = i;
+    drawPanels();
+    updateTitle();
+  }).catch(() => {}).finally(() => { S.loading = false; });
+}
+
+function markerX(pos, offset, max, w) { return Math.round((pos - offset) / max * (w - 1)); }
+
+function drawMarkers(ctx, w, h, key, offset, max) {
+  if (max <= 0) return;
+  for (const c of S.info.candidates) {
+    const p = c[key] - offset;
+    if (p < 0 || p > max) continue;
+    const x = markerX(c[key], offset, max, w);
+    ctx.fillStyle = CANDIDATE_COLORS[c.source] || '#ccc';
+    ctx.fillRect(x - 1, 0, 2, 6); ctx.fillRect(x - 1, h - 6, 2, 6);
+  }
+  ctx.fillStyle = '#ff0';
+  ctx.font = '10px sans-serif';
+  for (const [n, e] of Object.entries(S.events)) {
+    const p = (key === 'time' ? e.time : e.frame) - offset;
+    if (p < 0 || p > max) continue;
+    const x = markerX(p + offset, offset, max, w);
+    ctx.fillRect(x, 0, 1, h); ctx.fillText(`E${n}`, x + 2, 16);
+  }
+}
+
+function drawPlayhead(ctx, w, h, pos, max) {
+  if (max <= 0) return;
+  const x = Math.max(0, Math.min(w - 1, Math.round(pos / max * (w - 1))));
+  ctx.fillStyle = 'rgb(255,180,0)';
+  ctx.fillRect(x, 0, 1, h);
+}
+
+function drawPanels() {
+  const w = frameWidth(), h = 140, t = S.cur / fps();
+  for (const id of ['audioPanel', 'velocityPanel', 'controls']) {
+    const el = $(id); el.style.width = w + 'px';
+    if (el.tagName === 'CANVAS') { el.width = w; el.height = h; }
+  }
+  const a = $('audioPanel').getContext('2d');
+  if (S.audioZoom > 0 && S.view) {
+    a.drawImage(S.view.img, 0, 0, w, h);
+    drawMarkers(a, w, h, 'time', S.view.start, S.view.duration);
+    drawPlayhead(a, w, h, t - S.view.start, S.view.duration);
+    a.fillStyle = 'rgb(255,180,0)'; a.fillText(`x${2 ** S.audioZoom}`, w - 30, 14);
+  } else {
+    a.drawImage(S.mode === 0 ? S.panels.waveform : S.panels.spectrogram, 0, 0, w, h);
+    drawMarkers(a, w, h, 'time', 0, S.info.audio_duration);
+    drawPlayhead(a, w, h, t, S.info.audio_duration);
+  }
+  const v = $('velocityPanel').getContext('2d');
+  v.drawImage(S.panels.velocity, 0, 0, w, h);
+  drawMarkers(v, w, h, 'frame', 0, S.info.frame_count - 1);
+  if (S.info.has_velocity) drawPlayhead(v, w, h, S.cur, S.info.frame_count - 1);
+  if (S.audioZoom > 0) requestAudioView(t);
+}
+
+let viewInFlight = false;
+async function requestAudioView(t) {
+  if (viewInFlight || !S.info.channels) return;
+  viewInFlight = true;
+  try {
+    const r = await fetch(api(`/audio-view.png?t=${t}&level=${S.audioZoom}&mode=${S.mode}&channel=${S.channel}`));
+    const img = await createImageBitmap(await r.blob());
+    S.view = {img, start: parseFloat(r.headers.get('X-View-Start')), duration: parseFloat(r.headers.get('X-View-Duration'))};
+  } finally { viewInFlight = false; }
+}
+
+function updateTitle() {
+  let t = `${S.info.video_file} | ${S.cur}(${(S.cur / fps()).toFixed(2)}s)`;
+  const ex = Object.entries(S.info.annotations);
+  if (ex.length) t += ' | Existing :' + ex.map(([k, v]) => ` ${k}: F(T): ${v.frame}(${v.time.toFixed(2)}s)`).join('');
+  if (S.info.channels > 1) t += ` | Ch ${S.channel}/${S.info.channels}`;
+  if (S.snap) t += ' | SNAP';
+  const nw = Object.keys(S.events).sort((a, b) => a - b).map(k => `E${k} F(T): ${S.events[k].frame}(${S.events[k].time.toFixed(2)}s)`);
+  if (nw.length) t += ' | New : ' + nw.join(' | ');
+  if (S.error) t += ` | ${S.error}`;
+  $('title').textContent = t;
+  $('title').style.color = S.error ? '#ff5050' : '';
+  document.title = t;
+  $('wave').classList.toggle('selected', S.mode === 0);
+  $('spec').classList.toggle('selected', S.mode === 1);
+  $('speedLabel').textContent = `Speed ${S.speed}%`;
+}
+
+function setPaused(p) {
+  S.paused = p;
+  const audio = $('audio');
+  if (p) { audio.pause(); S.playStart = null; return; }
+  S.playStart = {time: performance.now(), frame: S.cur};
+  if (audio.src) { audio.currentTime = S.cur / fps(); audio.playbackRate = Math.max(0.07, S.speed / 100); audio.play().catch(() => {}); }
+}
+
+function seek(i) {
+  S.cur = Math.max(0, Math.min(S.info.frame_count - 1, i));
+  if ($('audio').src) $('audio').currentTime = S.cur / fps();
+  if (!S.paused) S.playStart = {time: performance.now(), frame: S.cur};
+  showFrame();
+}
+
+function tick() {
+  if (S.info && !S.paused && S.playStart) {
+    const elapsed = (performance.now() - S.playStart.time) / 1000;
+    const target = S.playStart.frame + Math.floor(elapsed * fps() * S.speed / 100);
+    if (target >= S.info.frame_count - 1) { S.cur = S.info.frame_count - 1; setPaused(true); }
+    else S.cur = target;
+    if (S.cur !== S.shown) showFrame();
+  }
+  requestAnimationFrame(tick);
+}
+
+function mark(n, frame, time) {
+  if (n > 1 && !S.events[n - 1]) return;
+  const prev = n === 1 ? S.events[2] : S.events[n - 1];
+  S.events[n] = {frame, time};
+  if (prev && (n === 1 ? frame > prev.frame : frame < prev.frame)) {
+    for (let k = n === 1 ? 2 : n; k <= 8; k++) delete S.events[k];
+  }
+}
+
+function nearestCandidate(frame) {
+  let best = null;
+  const maxDist = Math.max(1, Math.round(0.25 * fps()));
+  for (const c of S.info.candidates) {
+    const d = Math.abs(c.frame - frame);
+    if (d <= maxDist && (!best || d < Math.abs(best.frame - frame))) best = c;
+  }
+  return best;
+}
+
+async function save() {
+  if (!Object.keys(S.events).length) return true;
+  const r = await fetch(api('/annotations'), {method: 'POST', headers: {'Content-Type': 'application/json'},
+                                             body: JSON.stringify({annotations: S.events})}).catch(() => null);
+  const body = r ? await r.json().catch(() => ({})) : {};
+  // New events are kept on failure, so they can be saved again
+  if (!r || !r.ok) {
+    S.error = `Save failed: ${body.error || (r ? r.status : 'server not reachable')}`;
+    updateTitle();
+    return false;
+  }
+  S.info.annotations = body.annotations;
+  S.events = {};
+  S.error = null;
+  updateTitle();
+  return true;
+}
+
+async function switchChannel() {
+  S.channel = (S.channel + 1) % S.info.channels;
+  S.view = null;
+  await loadPanels();
+  const playing = !S.paused;
+  $('audio').src = api(`/audio.wav?channel=${S.channel}`);
+  if (playing) setPaused(false);
+  drawPanels();
+  updateTitle();
+}
+
+document.addEventListener('keydown', async ev => {
+  if (!S.info || ev.target.tagName === 'SELECT') return;
+  const k = ev.key;
+  const frame = S.shown !== undefined ? S.shown : S.cur;
+  if (/^[1-8]$/.test(k)) {
+    ev.preventDefault();
+    const n = parseInt(k);
+    if (ev.ctrlKey || ev.altKey) {
+      const e = S.info.annotations[k];
+      if (e) mark(n, e.frame, e.time);
+    } else {
+      let f = frame;
+      if (S.snap) { const c = nearestCandidate(f); if (c) f = c.frame; }
+      mark(n, f, f / fps());
+    }
+  } else if (k === ' ') { ev.preventDefault(); if (!S.paused) { S.cur = frame; } setPaused(!S.paused); }
+  else if (k === 'a' && S.paused) seek(S.cur - 1);
+  else if (k === 'd' && S.paused) seek(S.cur + 1);
+  else if (k === 'c') S.events = {};
+  else if (k === 'r') { S.zoom = 1; S.center = null; showFrame(); }
+  else if (k === 'm' && S.info.channels > 1) await switchChannel();
+  else if (k === 's') S.snap = !S.snap;
+  else if (k === ']' || k === '[') {
+    const cs = S.info.candidates;
+    const c = k === ']' ? cs.find(c => c.frame > S.cur) : [...cs].reverse().find(c => c.frame < S.cur);
+    if (c) { setPaused(true); seek(c.frame); }
+  }
+  else if (k === '+' || k === '=') S.audioZoom = Math.min(S.info.audio_zoom_levels, S.audioZoom + 1);
+  else if (k === '-') S.audioZoom = Math.max(0, S.audioZoom - 1);
+  else if (k === 'n' || k === 'p') { if (await save()) await loadVideo(S.vi + (k === 'n' ? 1 : -1)); return; }
+  else if (k === 'Escape') { await save(); setPaused(true); }
+  else return;
+  drawPanels();
+  updateTitle();
+});
+
+$('frame').addEventListener('wheel', ev => {
+  ev.preventDefault();
+  S.zoom = Math.max(1, Math.min(5, S.zoom + (ev.deltaY < 0 ? 0.2 : -0.2)));
+  const r = $('frame').getBoundingClientRect();
+  S.center = [Math.round((ev.clientX - r.left) * S.info.width / r.width), Math.round((ev.clientY - r.top) * S.info.height / r.height)];
+  showFrame();
+});
+$('audioPanel').addEventListener('wheel', ev => {
+  ev.preventDefault();
+  S.audioZoom = Math.max(0, Math.min(S.info.audio_zoom_levels, S.audioZoom + (ev.deltaY < 0 ? 1 : -1)));
+  drawPanels();
+});
+$('wave').onclick = () => { S.mode = 0; S.view = null; drawPanels(); updateTitle(); };
+$('spec').onclick = () => { S.mode = 1; S.view = null; drawPanels(); updateTitle(); };
+$('save').onclick = save;
+$('speed').oninput = ev => { S.speed = parseInt(ev.target.value); if (!S.paused) setPaused(false); updateTitle(); };
+$('video').onchange = async ev => {
+  if (await save()) await loadVideo(parseInt(ev.target.value));
+  else ev.target.value = S.vi;
+};
+
+(async () => {
+  S.videos = await (await fetch('/api/videos')).json();
+  for (const v of S.videos) {
+    const o = document.createElement('option');
+    o.value = v.index;
+    o.textContent = v.video_file + (v.missing.length ? '' : ' ✓');
+    $('video').appendChild(o);
+  }
+  if (S.videos.length) await loadVideo(0);
+  requestAnimationFrame(tick);
+})();
+</script>
+</body>
+</html>
+"""
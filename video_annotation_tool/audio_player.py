@@ -16,25 +16,28 @@ class AudioPlayer:
         if audio_data is None or audio_sr is None:
             return
 
-        self._channel_data = audio_data[audio_channel].astype(np.float32)
+        # All channels are kept so the played channel can be switched without reloading
+        self._audio = np.atleast_2d(audio_data).astype(np.float32)
+        self._channel = audio_channel
 
         def callback(outdata, frames, time_info, status):
             with self._lock:
                 if not self._playing:
                     outdata.fill(0)
                     return
+                channel_data = self._audio[self._channel]
                 pos = self._pos
                 end = pos + frames
-                if pos >= len(self._channel_data):
+                if pos >= len(channel_data):
                     outdata.fill(0)
                     return
-                if end > len(self._channel_data):
-                    valid = len(self._channel_data) - pos
-                    outdata[:valid, 0] = self._channel_data[pos:pos + valid]
+                if end > len(channel_data):
+                    valid = len(channel_data) - pos
+                    outdata[:valid, 0] = channel_data[pos:pos + valid]
                     outdata[valid:, 0] = 0
-                    self._pos = len(self._channel_data)
+                    self._pos = len(channel_data)
                 else:
-                    outdata[:, 0] = self._channel_data[pos:end]
+                    outdata[:, 0] = channel_data[pos:end]
                     self._pos = end
 
         try:
@@ -72,6 +75,13 @@ class AudioPlayer:
         with self._lock:
             self._pos = int(time_in_seconds * self._sr)
 
+    def set_channel(self, audio_channel):
+        """Switch the played channel, keeping the current position."""
+        if self._stream is None:
+            return
+        with self._lock:
+            self._channel = audio_channel
+
     def stop(self):
         """Stop and close the audio stream."""
         if self._stream is not None:
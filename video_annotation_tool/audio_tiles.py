@@ -0,0 +1,198 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+
+TILE_WIDTH = 256
+MAX_ZOOM_LEVEL = 8
+CACHE_TILES = 96
+
+
+class AudioTileCache:
+    """Renders time-zoomed waveform/spectrogram tiles in a worker pool and keeps them in an LRU cache."""
+
+    def __init__(self, audio_signal, audio_sr, view_width, height, tile_width=TILE_WIDTH,
+                 max_tiles=CACHE_TILES, workers=2, nfft=512, noverlap=384,
+                 bg=(24, 24, 24), fg=(230, 230, 230)):
+        # Keep a reference to the caller's samples, frames are converted to float32 when they are read
+        self._signal = np.atleast_2d(np.asarray(audio_signal))
+        self._sr = audio_sr
+        self._view_width = max(1, int(view_width))
+        self._height = max(1, int(height))
+        self._tile_width = tile_width
+        self._max_tiles = max_tiles
+        self._nfft = nfft
+        self._hop = max(1, nfft - noverlap)
+        self._bg = bg
+        self._fg = fg
+        self._window = np.hanning(nfft).astype(np.float32)
+        self._db_ranges = {}
+
+        self._tiles = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='audio-tiles')
+
+        # Level 0 shows the whole recording in the view width, every level doubles the time resolution.
+        self._n_samples = self._signal.shape[1]
+        self._base_spp = max(1.0, self._n_samples / float(self._view_width))
+        self.max_level = 0
+        while self.max_level < MAX_ZOOM_LEVEL and self._base_spp / 2 ** (self.max_level + 1) >= 1.0:
+            self.max_level += 1
+
+    def samples_per_column(self, level):
+        return self._base_spp / 2 ** level
+
+    def clamp_level(self, level):
+        return max(0, min(self.max_level, int(level)))
+
+    def view_window(self, center_time, level):
+        """Return (start_time, duration) of the view centred on the playhead at the given zoom level."""
+        spp = self.samples_per_column(level)
+        total_cols = int(np.ceil(self._n_samples / spp))
+        start_col = int(center_time * self._sr / spp) - self._view_width // 2
+        start_col = max(0, min(start_col, total_cols - self._view_width))
+        return start_col * spp / self._sr, self._view_width * spp / self._sr
+
+    def render_view(self, center_time, level, mode, channel=0):
+        """Compose the visible part of the panel from cached tiles, scheduling missing ones."""
+        level = self.clamp_level(level)
+        spp = self.samples_per_column(level)
+        start_time, duration = self.view_window(center_time, level)
+        start_col = int(round(start_time * self._sr / spp))
+        end_col = start_col + self._view_width
+
+        img = np.full((self._height, self._view_width, 3), self._bg, dtype=np.uint8)
+        first_tile = start_col // self._tile_width
+        last_tile = (end_col - 1) // self._tile_width
+        for index in range(first_tile, last_tile + 1):
+            tile = self.get_tile(mode, level, index, channel)
+            if tile is None:
+                continue
+            tile_start = index * self._tile_width
+            s = max(start_col, tile_start)
+            e = min(end_col, tile_start + self._tile_width)
+            img[:, s - start_col:e - start_col] = tile[:, s - tile_start:e - tile_start]
+
+        for index in (first_tile - 1, last_tile + 1):
+            if index >= 0:
+                self._schedule(mode, level, index, channel)
+
+        return img, start_time, duration
+
+    def get_tile(self, mode, level, index, channel=0):
+        """Return the tile if it is cached, otherwise schedule it and return None."""
+        key = (mode, level, index, channel)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                return tile
+        self._schedule(mode, level, index, channel)
+        return None
+
+    def _schedule(self, mode, level, index, channel):
+        key = (mode, level, index, channel)
+        with self._lock:
+            if key in self._tiles or key in self._pending:
+                return
+            try:
+                self._pending[key] = self._executor.submit(self._render_tile, key)
+            except RuntimeError:
+                # Executor already shut down
+                pass
+
+    def _render_tile(self, key):
+        mode, level, index, channel = key
+        try:
+            if mode == 0:
+                tile = self._waveform_tile(level, index, channel)
+            else:
+                tile = self._spectrogram_tile(level, index, channel)
+        except Exception as e:
+            print(f"Error rendering audio tile {key}: {e}")
+            tile = None
+
+        with self._lock:
+            self._pending.pop(key, None)
+            if tile is not None:
+                self._tiles[key] = tile
+                while len(self._tiles) > self._max_tiles:
+                    self._tiles.popitem(last=False)
+
+    def _column_bounds(self, level, index):
+        spp = self.samples_per_column(level)
+        cols = index * self._tile_width + np.arange(self._tile_width + 1)
+        bounds = np.minimum((cols * spp).astype(np.int64), self._n_samples)
+        return bounds
+
+    def _waveform_tile(self, level, index, channel):
+        h = self._height
+        tile = np.full((h, self._tile_width, 3), self._bg, dtype=np.uint8)
+        cv2.line(tile, (0, h // 2), (self._tile_width - 1, h // 2), (100, 100, 100), 1)
+
+        bounds = self._column_bounds(level, index)
+        valid = bounds[1:] > bounds[:-1]
+        if not valid.any():
+            return tile
+
+        n_valid = int(np.count_nonzero(valid))
+        starts = bounds[:-1][valid]
+        seg = self._signal[channel, starts[0]:bounds[n_valid]]
+        offsets = starts - starts[0]
+        max_val = np.maximum.reduceat(seg, offsets)
+        min_val = np.minimum.reduceat(seg, offsets)
+
+        y_min = ((1 - max_val) * 0.5 * (h - 1)).astype(np.int32)
+        y_max = ((1 - min_val) * 0.5 * (h - 1)).astype(np.int32)
+        rows = np.arange(h)[:, None]
+        mask = (rows >= y_min[None, :]) & (rows <= y_max[None, :])
+        tile[:, :n_valid][mask] = self._fg
+        return tile
+
+    def _power_frames(self, centers, channel):
+        # Frames reaching past either end of the signal are zero-padded there
+        idx = centers[:, None] + np.arange(-self._nfft // 2, self._nfft // 2)[None, :]
+        inside = (idx >= 0) & (idx < self._n_samples)
+        samples = self._signal[channel][np.clip(idx, 0, max(0, self._n_samples - 1))]
+        frames = np.where(inside, samples, 0).astype(np.float32, copy=False) * self._window
+        return np.abs(np.fft.rfft(frames, axis=1)) ** 2
+
+    def _db_range(self, channel):
+        if channel in self._db_ranges:
+            return self._db_ranges[channel]
+        centers = np.linspace(0, max(0, self._n_samples - 1), num=256).astype(np.int64)
+        db = 10.0 * np.log10(self._power_frames(centers, channel) + 1e-12)
+        vmax = float(np.percentile(db, 99.5))
+        self._db_ranges[channel] = (vmax - 80.0, vmax)
+        return self._db_ranges[channel]
+
+    def _spectrogram_tile(self, level, index, channel):
+        tile = np.full((self._height, self._tile_width, 3), self._bg, dtype=np.uint8)
+        bounds = self._column_bounds(level, index)
+        valid = bounds[1:] > bounds[:-1]
+        n_valid = int(np.count_nonzero(valid))
+        if n_valid == 0:
+            return tile
+
+        # Average a few STFT frames per column when a column spans more than one hop
+        spp = self.samples_per_column(level)
+        per_col = int(min(8, max(1, np.ceil(spp / self._hop))))
+        starts = bounds[:n_valid].astype(np.float64)
+        sub = (np.arange(per_col) + 0.5) / per_col * spp
+        centers = (starts[:, None] + sub[None, :]).astype(np.int64).ravel()
+
+        power = self._power_frames(centers, channel).reshape(n_valid, per_col, -1).mean(axis=1)
+        db = 10.0 * np.log10(power + 1e-12)
+        vmin, vmax = self._db_range(channel)
+        norm = np.clip((db - vmin) / (vmax - vmin), 0.0, 1.0)
+        gray = (norm.T[::-1] * 255).astype(np.uint8)
+        gray = cv2.resize(gray, (n_valid, self._height), interpolation=cv2.INTER_LINEAR)
+        tile[:, :n_valid] = cv2.applyColorMap(gray, cv2.COLORMAP_MAGMA)
+        return tile
+
+    def close(self):
+        """Cancel pending tiles and stop the worker pool."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,153 @@
+import subprocess
+import numpy as np
+
+
+ENVELOPE_RATE = 1000
+EXTRACT_RATE = 16000
+MAX_LAG_SECONDS = 5.0
+SEGMENT_MAX_LAG_SECONDS = 0.5
+SEGMENTS = 8
+GLOBAL_WINDOW_SECONDS = 60.0
+AGREEMENT_SECONDS = 0.01
+MIN_SCORE = 0.3
+DURATION_EPS = 0.1
+
+
+def extract_audio_track(video_path, sr=EXTRACT_RATE):
+    """Decode the first audio stream of a video to mono float32 with ffmpeg, or None if it has none."""
+    command = [
+        "ffmpeg", "-v", "error",
+        "-i", video_path,
+        "-vn", "-ac", "1", "-ar", str(sr),
+        "-f", "f32le", "-"
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0 or not result.stdout:
+        return None
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def amplitude_envelope(x, sr, rate=ENVELOPE_RATE):
+    """RMS envelope of a (channels, samples) or (samples,) signal at `rate` Hz, channels mixed down."""
+    x = np.atleast_2d(x)
+    hop = max(1, int(round(sr / rate)))
+    n = x.shape[1] // hop
+    energy = np.square(x[:, :n * hop], dtype=np.float32).reshape(x.shape[0], n, hop).mean(axis=(0, 2))
+    env = np.sqrt(energy)
+    return env - env.mean()
+
+
+def cross_correlation_lag(reference, signal, max_lag, center=0):
+    """Return (lag, score) maximising the correlation of signal[n + lag] with reference[n], |lag - center| <= max_lag.
+
+    Returns (0, 0.0) when no lag in that range overlaps both signals.
+    """
+    max_lag = int(max_lag)
+    if len(reference) == 0 or len(signal) == 0 or max_lag < 0:
+        return 0, 0.0
+    lo = max(int(center) - max_lag, -(len(reference) - 1))
+    hi = min(int(center) + max_lag, len(signal) - 1)
+    if lo > hi:
+        return 0, 0.0
+
+    n = len(reference) + len(signal) - 1
+    nfft = 1 << int(np.ceil(np.log2(max(2, n))))
+    xc = np.fft.irfft(np.fft.rfft(signal, nfft) * np.conj(np.fft.rfft(reference, nfft)), nfft)
+
+    lags = np.arange(lo, hi + 1)
+    values = xc[lags % nfft]
+    best = int(np.argmax(values))
+    norm = np.linalg.norm(reference) * np.linalg.norm(signal)
+    score = float(values[best] / norm) if norm > 0 else 0.0
+    return int(lags[best]), score
+
+
+def _centered(x):
+    return x - x.mean() if len(x) else x
+
+
+def estimate_offset_and_drift(video_audio, video_sr, wav_signal, wav_sr):
+    """Estimate offset (s) and drift (s/s) so that wav_time = video_time * (1 + drift) + offset."""
+    ref = amplitude_envelope(video_audio, video_sr)
+    sig = amplitude_envelope(wav_signal, wav_sr)
+    if len(ref) < ENVELOPE_RATE or len(sig) < ENVELOPE_RATE:
+        return None
+
+    # Drift smears the correlation of long recordings, so the global lag is measured on the beginning only
+    max_lag = int(MAX_LAG_SECONDS * ENVELOPE_RATE)
+    head = int(GLOBAL_WINDOW_SECONDS * ENVELOPE_RATE)
+    lag, score = cross_correlation_lag(_centered(ref[:head]), _centered(sig[:head + max_lag]), max_lag)
+
+    # Re-measure the lag on segments in a symmetric window around where each one is expected, following the drift
+    seg_len = len(ref) // SEGMENTS
+    seg_max_lag = int(SEGMENT_MAX_LAG_SECONDS * ENVELOPE_RATE)
+    times, offsets, scores = [], [], []
+    expected = lag
+    for k in range(SEGMENTS if seg_len >= ENVELOPE_RATE else 0):
+        s = k * seg_len
+        start = max(0, s + expected - seg_max_lag)
+        end = min(len(sig), s + expected + seg_len + seg_max_lag)
+        if end - start < ENVELOPE_RATE:
+            continue
+        seg_lag, seg_score = cross_correlation_lag(_centered(ref[s:s + seg_len]), _centered(sig[start:end]),
+                                                   seg_max_lag, s + expected - start)
+        if seg_score >= MIN_SCORE:
+            expected = seg_lag + start - s
+            times.append((s + seg_len / 2.0) / ENVELOPE_RATE)
+            offsets.append(expected / float(ENVELOPE_RATE))
+            scores.append(seg_score)
+
+    offset = lag / float(ENVELOPE_RATE)
+    drift = 0.0
+    if len(times) >= 2:
+        drift, offset = np.polyfit(times, offsets, 1)
+        residual = np.abs(np.polyval((drift, offset), times) - offsets).max()
+        if score < MIN_SCORE and residual <= AGREEMENT_SECONDS:
+            # The segments agree on one line even though the beginning alone correlates weakly
+            score = float(np.mean(scores))
+    elif score < MIN_SCORE:
+        return {"offset": offset, "drift": 0.0, "score": score, "method": "xcorr"}
+
+    return {"offset": float(offset), "drift": float(drift), "score": score, "method": "xcorr"}
+
+
+def estimate_av_sync(video_path, wav_signal, wav_sr, fps, total_frames):
+    """Measure the lag between the video's own audio track and the external WAV.
+
+    Falls back to comparing durations, with no offset, when the video has no usable audio track.
+    Returns None when the recordings do not seem to belong together.
+    """
+    video_audio = extract_audio_track(video_path)
+    if video_audio is not None:
+        sync = estimate_offset_and_drift(video_audio, EXTRACT_RATE, wav_signal, wav_sr)
+        if sync is not None and sync["score"] >= MIN_SCORE:
+            return sync
+        print(f"Cross-correlation with {video_path} inconclusive, comparing durations instead")
+
+    video_duration = total_frames / float(fps)
+    audio_duration = wav_signal.shape[-1] / float(wav_sr)
+    if abs(video_duration - audio_duration) < DURATION_EPS:
+        return {"offset": 0.0, "drift": 0.0, "score": None, "method": "duration"}
+    return None
+
+
+def estimate_track_lag(reference_path, other_path, max_lag_seconds=MAX_LAG_SECONDS):
+    """Return (lag, score) in seconds with other_time = reference_time + lag from the audio tracks of two videos.
+
+    Returns None when either video has no audio track or the tracks do not correlate.
+    """
+    reference = extract_audio_track(reference_path)
+    other = extract_audio_track(other_path)
+    if reference is None or other is None:
+        return None
+    ref = amplitude_envelope(reference, EXTRACT_RATE)
+    sig = amplitude_envelope(other, EXTRACT_RATE)
+    lag, score = cross_correlation_lag(ref, sig, max_lag_seconds * ENVELOPE_RATE)
+    if score < MIN_SCORE:
+        return None
+    return lag / float(ENVELOPE_RATE), score
+
+
+def frame_to_sample(time_in_seconds, audio_sr, sync):
+    """Map a video time to a WAV sample index using an offset/drift estimate."""
+    return int(round((time_in_seconds * (1.0 + sync["drift"]) + sync["offset"]) * audio_sr))
@@ -0,0 +1,105 @@
+import numpy as np
+from scipy.signal import find_peaks
+
+
+ONSET_HOP_SECONDS = 0.005
+ONSET_MIN_DISTANCE_SECONDS = 0.05
+ONSET_THRESHOLD_MADS = 6.0
+ONSET_MIN_RELATIVE = 0.2
+STOP_SPEED_FRACTION = 0.1
+VELOCITY_CONTEXT_FRAMES = 15
+MAX_CANDIDATES = 40
+
+
+def audio_onset_candidates(audio_signal, sr, hop_seconds=ONSET_HOP_SECONDS, min_distance=ONSET_MIN_DISTANCE_SECONDS):
+    """Return (times, scores) of acoustic transients found in the onset strength of the audio envelope."""
+    x = np.atleast_2d(audio_signal)
+    hop = max(1, int(round(sr * hop_seconds)))
+    n = x.shape[1] // hop
+    if n < 3:
+        return np.zeros(0), np.zeros(0)
+
+    # RMS envelope over all channels, so the result does not depend on the displayed channel
+    energy = np.square(x[:, :n * hop], dtype=np.float32).reshape(x.shape[0], n, hop).mean(axis=2).max(axis=0)
+    log_env = np.log10(np.sqrt(energy) + 1e-6)
+    change = np.diff(log_env, prepend=log_env[0])
+    onset = np.maximum(change, 0.0)
+
+    # Noise level from the full (not rectified) envelope change, whose MAD does not collapse to zero
+    median = np.median(change)
+    mad = np.median(np.abs(change - median)) + 1e-9
+    peaks, _ = find_peaks(onset, height=median + ONSET_THRESHOLD_MADS * mad,
+                          distance=max(1, int(round(min_distance / hop_seconds))))
+    if peaks.size:
+        peaks = peaks[onset[peaks] >= ONSET_MIN_RELATIVE * onset[peaks].max()]
+    return peaks * hop / float(sr), onset[peaks]
+
+
+def velocity_candidates(frames, velocities, stop_fraction=STOP_SPEED_FRACTION, context=VELOCITY_CONTEXT_FRAMES):
+    """Return (frames, scores) where the velocity changes sign or the needle starts/stops moving."""
+    v = np.asarray(velocities, dtype=np.float64)
+    frames = np.asarray(frames, dtype=np.int64)
+    if v.shape[0] < 3:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    speed = np.abs(v)
+    padded = np.pad(speed, context, mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * context + 1)
+    local_peak = windows.max(axis=1)
+
+    sign = np.sign(v)
+    crossings = np.nonzero(sign[:-1] * sign[1:] < 0)[0] + 1
+
+    moving = speed > stop_fraction * speed.max()
+    transitions = np.nonzero(moving[:-1] != moving[1:])[0] + 1
+
+    idx = np.union1d(crossings, transitions)
+    return frames[idx], local_peak[idx]
+
+
+def _normalized(scores):
+    if scores.size == 0:
+        return scores
+    return scores / max(float(scores.max()), 1e-12)
+
+
+def detect_event_candidates(fps, audio_signal=None, audio_sr=None, frames=None, velocities=None,
+                            max_candidates=MAX_CANDIDATES):
+    """Rank audio and velocity candidates together and return them as dicts sorted by time."""
+    found = []
+
+    if audio_signal is not None and audio_sr is not None:
+        times, scores = audio_onset_candidates(audio_signal, audio_sr)
+        for t, score in zip(times, _normalized(scores)):
+            found.append({'frame': int(round(t * fps)), 'time': float(t), 'score': float(score), 'source': 'audio'})
+
+    if frames is not None and velocities is not None:
+        cand_frames, scores = velocity_candidates(frames, velocities)
+        # Frames in the position CSV start at 1
+        for f, score in zip(cand_frames, _normalized(scores)):
+            frame = max(0, int(f) - 1)
+            found.append({'frame': frame, 'time': frame / float(fps), 'score': float(score), 'source': 'velocity'})
+
+    found.sort(key=lambda c: c['score'], reverse=True)
+    found = found[:max_candidates]
+    for rank, candidate in enumerate(found):
+        candidate['rank'] = rank + 1
+    found.sort(key=lambda c: c['frame'])
+    return found
+
+
+def nearest_candidate(candidates, frame_index, max_distance):
+    """Return the candidate closest to frame_index within max_distance frames, or None."""
+    best = None
+    for candidate in candidates:
+        distance = abs(candidate['frame'] - frame_index)
+        if distance <= max_distance and (best is None or distance < abs(best['frame'] - frame_index)):
+            best = candidate
+    return best
+
+
+def next_candidate(candidates, frame_index, direction):
+    """Return the first candidate after (direction > 0) or before (direction < 0) frame_index."""
+    if direction > 0:
+        return next((c for c in candidates if c['frame'] > frame_index), None)
+    return next((c for c in reversed(candidates) if c['frame'] < frame_index), None)
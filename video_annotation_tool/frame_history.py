@@ -0,0 +1,114 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+
+HISTORY_CODECS = ('jpg', 'png', 'raw')
+HOT_FRAMES = 15
+MEMORY_LIMIT_MB = 2048
+
+
+class FrameHistory:
+    """Decoded frames by index, compressed by worker threads except for a few raw frames around the playhead.
+
+    Frames are encoded with `codec` ('jpg', 'png' or 'raw' for no compression) once they leave the hot window
+    and decoded again on access. When the encoded frames exceed `memory_limit_mb`, those farthest from the
+    playhead are dropped and `get` returns None for them.
+    """
+
+    def __init__(self, codec='jpg', quality=95, hot_frames=HOT_FRAMES, read_ahead=30, memory_limit_mb=MEMORY_LIMIT_MB,
+                 workers=2):
+        if codec not in HISTORY_CODECS:
+            raise ValueError(f"Unsupported history codec {codec!r}, expected one of {', '.join(HISTORY_CODECS)}")
+        self._codec = codec
+        if codec == 'jpg':
+            self._params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif codec == 'png':
+            self._params = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+        self._behind = hot_frames
+        self._ahead = hot_frames + read_ahead
+        self._limit = memory_limit_mb * 1024 * 1024
+
+        self._raw = {}
+        self._encoded = {}
+        self._pending = set()
+        self._bytes = 0
+        self._playhead = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        if codec != 'raw':
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='frame-history')
+
+    @property
+    def memory_bytes(self):
+        with self._lock:
+            return self._bytes + sum(frame.nbytes for frame in self._raw.values())
+
+    def _is_hot(self, index):
+        return self._playhead - self._behind <= index <= self._playhead + self._ahead
+
+    def add(self, index, frame):
+        with self._lock:
+            self._raw[index] = frame
+            self._trim()
+
+    def get(self, index):
+        """Return frame `index`, or None if it was never added or has been dropped."""
+        with self._lock:
+            self._playhead = index
+            frame = self._raw.get(index)
+            data = self._encoded.get(index) if frame is None else None
+            if frame is None and data is None:
+                self._trim()
+                return None
+
+        if frame is None:
+            frame = data if self._codec == 'raw' else cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+        with self._lock:
+            self._raw[index] = frame
+            self._trim()
+        return frame
+
+    def _trim(self):
+        # Called with the lock held: compress raw frames that left the hot window, drop their raw copy once encoded
+        for index in [i for i in self._raw if not self._is_hot(i)]:
+            if index in self._encoded:
+                del self._raw[index]
+            elif index not in self._pending:
+                if self._executor is None:
+                    self._store(index, self._raw.pop(index))
+                    continue
+                try:
+                    self._executor.submit(self._compress, index, self._raw[index])
+                    self._pending.add(index)
+                except RuntimeError:
+                    # Executor already shut down, keep the raw frame
+                    pass
+
+    def _compress(self, index, frame):
+        ok, buf = cv2.imencode('.' + self._codec, frame, self._params)
+        with self._lock:
+            self._pending.discard(index)
+            if not ok:
+                return
+            self._store(index, buf)
+            if not self._is_hot(index):
+                self._raw.pop(index, None)
+
+    def _store(self, index, data):
+        # Called with the lock held
+        if index in self._encoded:
+            self._bytes -= self._encoded[index].nbytes
+        self._encoded[index] = data
+        self._bytes += data.nbytes
+        if self._bytes > self._limit:
+            # Drop the frames farthest from the playhead until 10% below the limit
+            for i in sorted(self._encoded, key=lambda i: abs(i - self._playhead), reverse=True):
+                if self._bytes <= 0.9 * self._limit:
+                    break
+                self._bytes -= self._encoded.pop(i).nbytes
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
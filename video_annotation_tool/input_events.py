@@ -0,0 +1,97 @@
+import bisect
+import threading
+import time
+from collections import deque, namedtuple
+
+
+InputEvent = namedtuple('InputEvent', ['key', 'ctrl', 'timestamp'])
+
+CONFIRM_WINDOW_SECONDS = 1.0
+DISPLAY_LOG_SIZE = 512
+
+
+class InputEventQueue:
+    """Thread-safe queue of timestamped key presses.
+
+    Presses reported by the global keyboard listener carry the exact press time, but are only
+    used once the OpenCV window reports the same key, so typing into other applications is ignored.
+    Ctrl combinations never reach the window and are taken from the listener directly.
+    """
+
+    def __init__(self, confirm_window=CONFIRM_WINDOW_SECONDS):
+        self._confirm_window = confirm_window
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._ctrl_presses = deque()
+        self._ready = []
+        self._ctrl = False
+        self.listener_active = False
+
+    def set_ctrl(self, pressed):
+        with self._lock:
+            self._ctrl = pressed
+
+    def listener_press(self, key):
+        """Record a key press from the keyboard listener thread."""
+        timestamp = time.monotonic()
+        with self._lock:
+            event = InputEvent(key, self._ctrl, timestamp)
+            self.listener_active = True
+            if event.ctrl:
+                self._ready.append(event)
+                self._ctrl_presses.append(event)
+            else:
+                self._pending.append(event)
+
+    def window_key(self, key):
+        """Record a key returned by cv2.waitKey, matching it to the listener press if there is one."""
+        now = time.monotonic()
+        with self._lock:
+            for presses in (self._pending, self._ctrl_presses):
+                while presses and now - presses[0].timestamp > self._confirm_window:
+                    presses.popleft()
+            # The Ctrl state recorded at press time decides, not whether Ctrl is held now
+            for i, event in enumerate(self._pending):
+                if event.key == key:
+                    del self._pending[i]
+                    self._ready.append(event)
+                    return
+            for i, event in enumerate(self._ctrl_presses):
+                if event.key == key:
+                    # Already queued by the listener
+                    del self._ctrl_presses[i]
+                    return
+            if self._ctrl and self.listener_active:
+                return
+            self._ready.append(InputEvent(key, self._ctrl, now))
+
+    def drain(self):
+        """Return all confirmed events in press order and clear them."""
+        with self._lock:
+            events = sorted(self._ready, key=lambda e: e.timestamp)
+            self._ready = []
+        return events
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._ctrl_presses.clear()
+            self._ready = []
+
+
+class DisplayLog:
+    """Remembers which frame was on screen when, so key presses can be resolved to the frame the user saw."""
+
+    def __init__(self, size=DISPLAY_LOG_SIZE):
+        self._times = deque(maxlen=size)
+        self._frames = deque(maxlen=size)
+
+    def shown(self, frame_index, timestamp=None):
+        self._times.append(time.monotonic() if timestamp is None else timestamp)
+        self._frames.append(frame_index)
+
+    def frame_at(self, timestamp):
+        if not self._frames:
+            return None
+        i = bisect.bisect_right(self._times, timestamp) - 1
+        return self._frames[max(0, i)]
@@ -0,0 +1,122 @@
+import cv2
+import numpy as np
+
+
+MOTION_WIDTH = 160
+BATCH_FRAMES = 64
+SMOOTH_FRAMES = 5
+THRESHOLD_MADS = 4.0
+MIN_GAP_SECONDS = 0.2
+
+
+def roi_pixels(roi, width, height):
+    """Convert a (x, y, w, h) ROI given as fractions of the frame into pixel bounds (x1, y1, x2, y2)."""
+    if roi is None:
+        return 0, 0, width, height
+    x, y, w, h = roi
+    x1 = int(np.clip(round(x * width), 0, width - 1))
+    y1 = int(np.clip(round(y * height), 0, height - 1))
+    x2 = int(np.clip(round((x + w) * width), x1 + 1, width))
+    y2 = int(np.clip(round((y + h) * height), y1 + 1, height))
+    return x1, y1, x2, y2
+
+
+def compute_motion_index(video_path, roi=None, width=MOTION_WIDTH, should_stop=None):
+    """Mean absolute difference between consecutive downscaled grayscale frames, one value per frame.
+
+    Frames are streamed and differenced in small batches, so memory does not grow with the video length. `roi` is (x, y, w, h) as fractions of the
+    frame, so the same ROI applies to the original video and its proxy. Returns None if the video cannot be read.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return None
+
+    values = []
+    batch = []
+    prev = None
+    size = None
+    while should_stop is None or not should_stop():
+        ret, frame = cap.read()
+        if ret:
+            x1, y1, x2, y2 = roi_pixels(roi, frame.shape[1], frame.shape[0])
+            crop = frame[y1:y2, x1:x2]
+            if size is None:
+                scale = min(1.0, width / float(crop.shape[1]))
+                size = (max(1, int(crop.shape[1] * scale)), max(1, int(crop.shape[0] * scale)))
+            batch.append(cv2.cvtColor(cv2.resize(crop, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY))
+        if batch and (not ret or len(batch) == BATCH_FRAMES):
+            # Differences of a whole batch at once, carrying the last frame over to the next batch
+            frames = np.stack(batch if prev is None else [prev] + batch).astype(np.int16)
+            diffs = np.abs(np.diff(frames, axis=0)).mean(axis=(1, 2))
+            values.extend(([0.0] if prev is None else []) + diffs.tolist())
+            prev = batch[-1]
+            batch = []
+        if not ret:
+            break
+    cap.release()
+    return np.asarray(values, dtype=np.float32)
+
+
+def _smooth(motion, frames=SMOOTH_FRAMES):
+    if len(motion) < frames:
+        return motion
+    kernel = np.ones(frames, dtype=np.float32) / frames
+    return np.convolve(motion, kernel, mode='same')
+
+
+def motion_events(motion, fps, threshold_mads=THRESHOLD_MADS, min_gap_seconds=MIN_GAP_SECONDS):
+    """Return (onsets, stops): frames where the smoothed motion rises above / falls below a robust threshold.
+
+    The threshold is the median plus `threshold_mads` median absolute deviations, and pauses shorter than
+    `min_gap_seconds` do not split a movement.
+    """
+    if motion is None or len(motion) < 2:
+        return [], []
+    smooth = _smooth(motion)
+    median = float(np.median(smooth))
+    mad = float(np.median(np.abs(smooth - median))) or 1e-3
+    active = smooth > median + threshold_mads * mad
+
+    edges = np.diff(active.astype(np.int8))
+    onsets = list(np.flatnonzero(edges == 1) + 1)
+    stops = list(np.flatnonzero(edges == -1) + 1)
+    if active[0]:
+        onsets.insert(0, 0)
+    if active[-1]:
+        stops.append(len(active) - 1)
+
+    min_gap = max(1, int(round(min_gap_seconds * fps)))
+    merged_onsets, merged_stops = [], []
+    for onset, stop in zip(onsets, stops):
+        if merged_stops and onset - merged_stops[-1] < min_gap:
+            merged_stops[-1] = stop
+        else:
+            merged_onsets.append(onset)
+            merged_stops.append(stop)
+    return [int(f) for f in merged_onsets], [int(f) for f in merged_stops]
+
+
+def build_motion_image(motion, width, height, onsets=(), stops=(), bg=(255, 255, 255), line=(0, 120, 0), axis=(200, 200, 200),
+                       onset_color=(0, 200, 0), stop_color=(0, 0, 220)):
+    img = np.full((height, width, 3), bg, dtype=np.uint8)
+    if motion is None or len(motion) == 0:
+        cv2.putText(img, 'Computing motion...', (10, height // 2 + 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (120, 120, 120), 1)
+        return img
+
+    # Column maxima so short movements stay visible in long clips
+    n = len(motion)
+    bounds = np.linspace(0, n, num=min(width, n) + 1).astype(np.int64)
+    peaks = np.maximum.reduceat(motion, bounds[:-1])
+    top = float(np.percentile(motion, 99.5)) or 1.0
+    ys = ((1.0 - np.clip(peaks / top, 0.0, 1.0)) * (height - 3) + 1).astype(np.int32)
+    xs = (np.arange(len(peaks)) * (width - 1) / max(1, len(peaks) - 1)).astype(np.int32)
+
+    cv2.line(img, (0, height - 2), (width - 1, height - 2), axis, 1)
+    cv2.polylines(img, [np.stack([xs, ys], axis=1)], False, line, 1)
+    for frames, color in ((onsets, onset_color), (stops, stop_color)):
+        for f in frames:
+            x = int(f * (width - 1) / max(1, n - 1))
+            cv2.line(img, (x, 0), (x, 5), color, 2)
+            cv2.line(img, (x, height - 6), (x, height - 1), color, 2)
+    cv2.putText(img, 'motion', (5, 12), cv2.FONT_HERSHEY_SIMPLEX, 0.3, (50, 100, 50), 1)
+    return img
@@ -0,0 +1,235 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib import mlab
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import matplotlib.pyplot as plt
+import numpy as np
+import cv2
+from video_annotation_tool.annotation_files import load_velocity
+
+DEFAULT_PLOT_HEIGHT = 140
+CANDIDATE_COLORS = {'audio': (80, 220, 80), 'velocity': (255, 160, 0)}
+
+def compute_waveform_envelopes(audio_signal, width):
+    # Min/max per pixel column for all channels at once, shape (channels, columns)
+    n = audio_signal.shape[1]
+    samples_per_col = max(1, int(np.ceil(n / width)))
+    cols = int(np.ceil(n / samples_per_col))
+    x = np.pad(audio_signal, ((0, 0), (0, cols * samples_per_col - n)), mode='edge')
+    x = x.reshape(audio_signal.shape[0], cols, samples_per_col)
+    return x.min(axis=2), x.max(axis=2)
+
+def draw_waveform_envelope(img, min_vals, max_vals, fg=(230, 230, 230)):
+    height = img.shape[0]
+    cols = min(img.shape[1], min_vals.shape[0])
+    y_min = ((1 - max_vals[:cols]) * 0.5 * (height - 1)).astype(np.int32)
+    y_max = ((1 - min_vals[:cols]) * 0.5 * (height - 1)).astype(np.int32)
+    rows = np.arange(height)[:, None]
+    mask = (rows >= y_min[None, :]) & (rows <= y_max[None, :])
+    img[:, :cols][mask] = fg
+    return img
+
+def _empty_waveform_image(width, height, bg):
+    img = np.full((height, width, 3), bg, dtype=np.uint8)
+    mid_y = height // 2
+    cv2.line(img, (0, mid_y), (width - 1, mid_y), (100, 100, 100), 1)
+    return img
+
+def build_waveform_image(audio_signal, sr, width, height, audio_channel, bg=(24, 24, 24), fg=(230, 230, 230)):
+
+    if audio_signal is None or sr is None:
+        img = np.full((height, width, 3), bg, dtype=np.uint8)
+        cv2.putText(img, 'No audio data', (10, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        return img
+
+    min_vals, max_vals = compute_waveform_envelopes(audio_signal[audio_channel:audio_channel + 1], width)
+    img = _empty_waveform_image(width, height, bg)
+    return draw_waveform_envelope(img, min_vals[0], max_vals[0], fg)
+
+def compute_spectrogram_db(x, sr, nfft=1024, noverlap=768):
+    Pxx, freqs, bins = mlab.specgram(
+        x.astype(np.float32),
+        NFFT=nfft,
+        Fs=sr,
+        noverlap=noverlap,
+        mode='psd',
+        window=np.hanning(nfft),
+    )
+    db = 10.0 * np.log10(Pxx + 1e-12)
+    return db, freqs, bins
+
+def build_spectrogram_image(audio_signal, sr, width, height, audio_channel,
+                            bg=(24, 24, 24),
+                            nfft=1024, noverlap=768, max_freq=None):
+    if audio_signal is None or sr is None:
+        img = np.full((height, width, 3), bg, dtype=np.uint8)
+        cv2.putText(img, 'No audio data', (10, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        return img
+
+    db, freqs, bins = compute_spectrogram_db(audio_signal[audio_channel, :], sr, nfft, noverlap)
+    return render_spectrogram_image(db, freqs, bins, sr, width, height, bg, nfft, noverlap, max_freq)
+
+def render_spectrogram_image(db, freqs, bins, sr, width, height, bg=(24, 24, 24), nfft=1024, noverlap=768, max_freq=None):
+    dpi = 100
+    fig_w = max(1, int(width)) / dpi
+    fig_h = max(1, int(height)) / dpi
+    fig = plt.Figure(figsize=(fig_w, fig_h), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+
+    fig.patch.set_facecolor(np.array(bg) / 255.0)
+    ax.set_facecolor(np.array(bg) / 255.0)
+
+    # Same extent as Axes.specgram, which pads half a hop on both sides
+    pad_xextent = (nfft - noverlap) / sr / 2
+    extent = (np.min(bins) - pad_xextent, np.max(bins) + pad_xextent, freqs[0], freqs[-1])
+    im = ax.imshow(np.flipud(db), cmap='magma', extent=extent, origin='upper')
+    ax.axis('auto')
+
+    vmax = np.percentile(db, 99.5)
+    vmin = vmax - 80.0
+    im.set_clim(vmin, vmax)
+
+    if max_freq is not None:
+        ax.set_ylim(0, max_freq)
+    else:
+        ax.set_ylim(0, sr / 2)
+
+    ax.set_axis_off()
+
+    canvas.draw()
+    buf = np.frombuffer(canvas.buffer_rgba(), dtype=np.uint8)
+    img_rgba = buf.reshape(int(height), int(width), 4)
+    img_bgr = cv2.cvtColor(img_rgba, cv2.COLOR_RGBA2BGR)
+
+    return img_bgr
+
+def build_channel_panels(audio_signal, sr, width, height, nfft=512, noverlap=384, max_freq=None, workers=None):
+    # Waveform envelopes of every channel in one pass, spectrograms computed in parallel per channel
+    min_vals, max_vals = compute_waveform_envelopes(audio_signal, width)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        spectrograms = list(executor.map(lambda x: compute_spectrogram_db(x, sr, nfft, noverlap), audio_signal))
+
+    panels = []
+    for channel, (db, freqs, bins) in enumerate(spectrograms):
+        panels.append({
+            'waveform': draw_waveform_envelope(_empty_waveform_image(width, height, (24, 24, 24)), min_vals[channel], max_vals[channel]),
+            'spectrogram': render_spectrogram_image(db, freqs, bins, sr, width, height, nfft=nfft, noverlap=noverlap, max_freq=max_freq),
+        })
+    return panels
+
+def draw_zoom_label(img, zoom_factor, color=(0, 180, 255)):
+    h, w = img.shape[:2]
+    label = f'x{zoom_factor}'
+    cv2.putText(img, label, (max(0, w - 12 * len(label) - 6), 16), cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1, cv2.LINE_AA)
+    return img
+
+def draw_candidate_markers(img, candidates, position_key, offset, max_position, tick=6):
+    h, w = img.shape[:2]
+    if max_position <= 0:
+        return img
+    for candidate in candidates:
+        position = candidate[position_key] - offset
+        if position < 0 or position > max_position:
+            continue
+        x = int((position / float(max_position)) * (w - 1))
+        color = CANDIDATE_COLORS.get(candidate['source'], (200, 200, 200))
+        cv2.line(img, (x, 0), (x, tick), color, 2)
+        cv2.line(img, (x, h - 1 - tick), (x, h - 1), color, 2)
+    return img
+
+def draw_event_markers(img, annotations, position_key, offset, max_position, color=(0, 0, 255)):
+    h, w = img.shape[:2]
+    if max_position <= 0:
+        return img
+    for event, value in annotations.items():
+        if value.get(position_key) is None:
+            continue
+        position = value[position_key] - offset
+        if position < 0 or position > max_position:
+            continue
+        x = int((position / float(max_position)) * (w - 1))
+        cv2.line(img, (x, 0), (x, h - 1), color, 1)
+        cv2.putText(img, f'E{event}', (min(x + 3, w - 20), 14), cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1, cv2.LINE_AA)
+    return img
+
+def draw_playhead(img, position, max_position):
+    h, w = img.shape[:2]
+    
+    position = float(position)
+    x = int((position / float(max_position)) * (w - 1))
+    x = max(0, min(w - 1, x))
+    cv2.line(img, (x, 0), (x, h - 1), (0, 180, 255), 1)
+    return img
+
+def build_velocity_image(labelled_positions_path, width, height, bg=(255, 255, 255), line=(255, 0, 0), axis=(200, 200, 200),
+                         total_frames=None):
+    img = np.full((height, width, 3), bg, dtype=np.uint8)
+
+    if not labelled_positions_path or not os.path.exists(labelled_positions_path):
+        cv2.putText(img, 'No velocity data', (10, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        return img
+
+    frames, velocities = load_velocity(labelled_positions_path)
+
+    v_max = np.nanmax(velocities)
+    v_min = np.nanmin(velocities)
+    v_abs_max = float(np.nanmax(np.abs(velocities)))
+    v_norm = np.clip(velocities / v_abs_max, -1.0, 1.0)
+
+    # Same x scale as the video frame index, so candidate markers and the playhead line up with the curve
+    if total_frames is None:
+        total_frames = frames.shape[0]
+    pts = []
+    for frame, val in zip(frames, v_norm):
+        x = int((frame - 1) * (width - 1) / max(1, total_frames - 1))
+        y = int((1 - (val + 1) / 2) * (height - 1))
+        pts.append((x, y))
+
+    cv2.line(img, (0, height // 2), (width - 1, height // 2), axis, 1)
+
+    cv2.polylines(img, [np.array(pts, dtype=np.int32)], False, line, 1)
+
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    font_scale = 0.3
+    font_color = (50, 100, 50)
+    thickness = 1
+    margin_left = 5
+
+    label_top = f"{v_max:.1f} cm/s"
+    label_center = "0 cm/s"
+    label_bottom = f"{v_min:.1f} cm/s"
+
+    cv2.putText(img, label_top, (margin_left, 15), font, font_scale, font_color, thickness)
+    cv2.putText(img, label_center, (margin_left, height // 2 - 5), font, font_scale, font_color, thickness)
+    cv2.putText(img, label_bottom, (margin_left, height - 5), font, font_scale, font_color, thickness)
+
+    return img
+
+def get_zoomed_frame(frame, zoom_level, center=None, output_size=None):
+    h, w = frame.shape[:2]
+
+    if zoom_level <= 1.0:
+        if output_size is None or output_size == (w, h):
+            return frame
+        interpolation = cv2.INTER_AREA if output_size[0] < w or output_size[1] < h else cv2.INTER_LINEAR
+        return cv2.resize(frame, output_size, interpolation=interpolation)
+
+    new_w = int(w / zoom_level)
+    new_h = int(h / zoom_level)
+
+    if center is None:
+        center_x, center_y = w // 2, h // 2
+    else:
+        center_x, center_y = center
+
+    x1 = max(center_x - new_w // 2, 0)
+    y1 = max(center_y - new_h // 2, 0)
+    x2 = min(x1 + new_w, w)
+    y2 = min(y1 + new_h, h)
+
+    cropped = frame[y1:y2, x1:x2]
+    output_size = output_size or (w, h)
+    zoomed_frame = cv2.resize(cropped, output_size, interpolation=cv2.INTER_LINEAR)
+
+    return zoomed_frame
@@ -0,0 +1,229 @@
+import json
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+from video_annotation_tool.annotation_files import (
+    get_json_path, index_files, list_videos, match_file, read_wave,
+)
+from video_annotation_tool.panels import (
+    DEFAULT_PLOT_HEIGHT, build_spectrogram_image, build_velocity_image, build_waveform_image, draw_event_markers,
+    draw_playhead, get_zoomed_frame,
+)
+
+RENDER_WIDTH = 1280
+CHUNK_SECONDS = 30.0
+PANEL_MODES = {'waveform': 0, 'spectrogram': 1}
+
+
+def _even(value):
+    return max(2, int(value) // 2 * 2)
+
+
+def read_annotation_file(video_path, video_root=None):
+    json_path = get_json_path(video_path, video_root)
+    if not os.path.exists(json_path):
+        return json_path, {}
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return json_path, json.load(f)
+
+
+def camera_annotations(video_annotations, video_file):
+    """Annotations with this camera's frames. cam1 and cam2 share one JSON, which keeps each camera's frame in `frames`."""
+    annotations = {}
+    for event, value in video_annotations.items():
+        frames = value.get('frames') or {}
+        annotations[event] = dict(value, frame=frames.get(video_file, value.get('frame')))
+    return annotations
+
+
+def compose_review_frame(frame, video_size, audio_panel, velocity_panel, frame_index, fps, audio_duration, total_frames,
+                         annotations, has_velocity):
+    """Stack the video frame, audio and velocity panels with playheads and E1-E8 markers, as in the annotation window."""
+    time_in_seconds = frame_index / fps
+    view = get_zoomed_frame(frame, 1.0, None, video_size).copy()
+
+    passed = [event for event, value in sorted(annotations.items(), key=lambda item: int(item[0]))
+              if value.get('frame') is not None and value['frame'] <= frame_index]
+    label = f'{frame_index} ({time_in_seconds:.2f}s)' + (f'  E{passed[-1]}' if passed else '')
+    cv2.putText(view, label, (10, 28), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 4, cv2.LINE_AA)
+    cv2.putText(view, label, (10, 28), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 1, cv2.LINE_AA)
+
+    sp = audio_panel.copy()
+    if audio_duration > 0:
+        draw_event_markers(sp, annotations, 'time', 0.0, audio_duration)
+        draw_playhead(sp, time_in_seconds, audio_duration)
+    vel = velocity_panel.copy()
+    draw_event_markers(vel, annotations, 'frame', 0, total_frames - 1)
+    if has_velocity:
+        draw_playhead(vel, frame_index, total_frames - 1)
+
+    return np.vstack([view, sp, vel])
+
+
+def render_chunk(job):
+    """Encode frames [start, end) of one video into its own file. Runs in a worker process."""
+    command = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "rawvideo", "-pix_fmt", "bgr24",
+        "-s", f"{job['size'][0]}x{job['size'][1]}", "-r", str(job['fps']),
+        "-i", "-",
+        "-an", "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p",
+        job['chunk_path']
+    ]
+    cap = cv2.VideoCapture(job['video_path'])
+    cap.set(cv2.CAP_PROP_POS_FRAMES, job['start'])
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    written = 0
+    try:
+        for frame_index in range(job['start'], job['end']):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            combined = compose_review_frame(frame, job['video_size'], job['audio_panel'], job['velocity_panel'], frame_index,
+                                            job['fps'], job['audio_duration'], job['total_frames'], job['annotations'],
+                                            job['has_velocity'])
+            proc.stdin.write(combined.tobytes())
+            written += 1
+    except BrokenPipeError:
+        pass
+    finally:
+        cap.release()
+        proc.stdin.close()
+        stderr = proc.stderr.read()
+        proc.wait()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed on {job['chunk_path']}: {stderr.decode(errors='replace')}")
+    return written
+
+
+def plan_review(video_path, audio_path, labelled_position_path, video_root, output_path, audio_channel, mode, width,
+                chunk_seconds, work_dir):
+    """Build the static panels once and split the video into chunk jobs. The source video is read as it is."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"Error: Could not open video {video_path}.")
+        return None
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    vw, vh = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    if total_frames <= 0:
+        print(f"Error: No frames in {video_path}.")
+        return None
+
+    plot_w = _even(min(width, vw))
+    video_size = (plot_w, _even(vh * plot_w / float(vw)))
+
+    audio_sr = None
+    audio_data = None
+    audio_duration = 0.0
+    if audio_path and os.path.exists(audio_path):
+        try:
+            audio_sr, audio_data = read_wave(audio_path)
+            audio_duration = audio_data.shape[1] / audio_sr
+        except Exception as e:
+            print(f"Error reading audio file {audio_path}: {e}")
+    if audio_data is not None and not 0 <= audio_channel < audio_data.shape[0]:
+        audio_channel = 0
+    if mode == 0:
+        audio_panel = build_waveform_image(audio_data, audio_sr, plot_w, DEFAULT_PLOT_HEIGHT, audio_channel)
+    else:
+        audio_panel = build_spectrogram_image(audio_data, audio_sr, plot_w, DEFAULT_PLOT_HEIGHT, audio_channel)
+    velocity_panel = build_velocity_image(labelled_position_path, plot_w, DEFAULT_PLOT_HEIGHT, total_frames=total_frames)
+
+    _, data = read_annotation_file(video_path, video_root)
+    audio_sync = data.get('audio_sync') if audio_path and data.get('audio_file') == os.path.basename(audio_path) else None
+    annotations = camera_annotations(data.get('video_annotations', {}), os.path.basename(video_path))
+
+    chunk_frames = max(1, int(round(chunk_seconds * fps)))
+    jobs = []
+    for k, start in enumerate(range(0, total_frames, chunk_frames)):
+        jobs.append({
+            'video_path': video_path,
+            'chunk_path': os.path.join(work_dir, f'chunk_{k:05d}.mp4'),
+            'start': start,
+            'end': min(total_frames, start + chunk_frames),
+            'fps': fps,
+            'size': (plot_w, video_size[1] + 2 * DEFAULT_PLOT_HEIGHT),
+            'video_size': video_size,
+            'audio_panel': audio_panel,
+            'velocity_panel': velocity_panel,
+            'audio_duration': audio_duration,
+            'total_frames': total_frames,
+            'annotations': annotations,
+            'has_velocity': bool(labelled_position_path and os.path.exists(labelled_position_path)),
+        })
+    return {'jobs': jobs, 'output_path': output_path, 'audio_path': audio_path if audio_data is not None else None,
+            'audio_channel': audio_channel, 'audio_sync': audio_sync, 'work_dir': work_dir}
+
+
+def concat_chunks(plan):
+    """Join the chunks without re-encoding and add the audio channel, shifted by the measured offset."""
+    list_path = os.path.join(plan['work_dir'], 'chunks.txt')
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for job in plan['jobs']:
+            f.write(f"file '{os.path.abspath(job['chunk_path'])}'\n")
+
+    command = ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+    if plan['audio_path']:
+        offset = plan['audio_sync']['offset'] if plan['audio_sync'] else 0.0
+        if offset >= 0:
+            command += ["-ss", f"{offset:.6f}", "-i", plan['audio_path']]
+        else:
+            command += ["-itsoffset", f"{-offset:.6f}", "-i", plan['audio_path']]
+        command += ["-map", "0:v", "-map", "1:a", "-af", f"pan=mono|c0=c{plan['audio_channel']}",
+                    "-c:a", "aac", "-b:a", "128k", "-shortest"]
+    command += ["-c:v", "copy", "-movflags", "+faststart", plan['output_path']]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        print(f"Error joining {plan['output_path']}:\n{result.stderr.decode(errors='replace')}")
+        return False
+    return True
+
+
+def _is_up_to_date(output_path, *sources):
+    if not os.path.exists(output_path):
+        return False
+    mtime = os.path.getmtime(output_path)
+    return all(mtime >= os.path.getmtime(p) for p in sources if p and os.path.exists(p))
+
+
+def render_reviews_in_folder(video_path, audio_path, labelled_position_path, output_path, audio_channel=0,
+                             mode='spectrogram', workers=None, chunk_seconds=CHUNK_SECONDS, width=RENDER_WIDTH):
+    """Render a review clip per video. Chunks of all videos share one process pool, each piping into its own ffmpeg."""
+    audio_files = index_files(audio_path, ('.wav',))
+    csv_files = index_files(labelled_position_path, ('.csv',))
+    mode = PANEL_MODES[mode]
+
+    with tempfile.TemporaryDirectory(prefix='review-') as tmp, ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for n, video_file in enumerate(list_videos(video_path)):
+            video_file_path = os.path.join(video_path, video_file)
+            audio_file_path = match_file(audio_files, video_file)
+            labelled_position_file_path = match_file(csv_files, video_file)
+            review_path = os.path.join(output_path, os.path.splitext(video_file)[0] + '_review.mp4')
+            json_path, _ = read_annotation_file(video_file_path, video_path)
+            if _is_up_to_date(review_path, video_file_path, audio_file_path, labelled_position_file_path, json_path):
+                print(f"{review_path} is up to date.")
+                continue
+
+            work_dir = os.path.join(tmp, str(n))
+            os.makedirs(work_dir)
+            os.makedirs(os.path.dirname(review_path) or '.', exist_ok=True)
+            plan = plan_review(video_file_path, audio_file_path, labelled_position_file_path, video_path, review_path,
+                               audio_channel, mode, width, chunk_seconds, work_dir)
+            if plan is not None:
+                pending.append((plan, [executor.submit(render_chunk, job) for job in plan['jobs']]))
+
+        for plan, futures in pending:
+            try:
+                frames = sum(future.result() for future in futures)
+            except Exception as e:
+                print(f"Error rendering {plan['output_path']}: {e}")
+                continue
+            if concat_chunks(plan):
+                print(f"Rendered {plan['output_path']} ({frames} frames, {len(futures)} chunks)")
@@ -1,16 +1,37 @@
 import cv2
 import argparse
+import itertools
 import json
 import os
+import re
 import subprocess
-from scipy.io import wavfile
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-import matplotlib.pyplot as plt
+from datetime import datetime
+from functools import lru_cache
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
 import cv2
-import pandas as pd
 from pynput import keyboard
 from video_annotation_tool.audio_player import AudioPlayer
+from video_annotation_tool.annotation_export import export_annotations
+from video_annotation_tool.annotation_files import (
+    REQUIRED_EVENTS, build_annotation_index, convert_video_to_h264, get_annotations_folder, get_event_candidates,
+    get_json_key, get_json_path, get_motion_path, get_proxy_path, index_files, list_videos, match_file, missing_events,
+    read_wave, save_video_annotations, update_annotations, write_audio_sync,
+)
+from video_annotation_tool.annotation_server import serve_folder
+from video_annotation_tool.audio_tiles import AudioTileCache
+from video_annotation_tool.av_sync import estimate_av_sync, estimate_track_lag
+from video_annotation_tool.event_candidates import nearest_candidate, next_candidate
+from video_annotation_tool.input_events import DisplayLog, InputEventQueue
+from video_annotation_tool.panels import (
+    DEFAULT_PLOT_HEIGHT, build_channel_panels, build_spectrogram_image, build_velocity_image, build_waveform_image,
+    draw_candidate_markers, draw_playhead, draw_zoom_label, get_zoomed_frame,
+)
+from video_annotation_tool.motion_index import build_motion_image, compute_motion_index, motion_events
+from video_annotation_tool.review_render import render_reviews_in_folder
+from video_annotation_tool.frame_history import HISTORY_CODECS
+from video_annotation_tool.video_stream import FrameReader, VideoStream
 
 WINDOW_NAME = 'Video Annotation'
 MAX_WINDOW_WIDTH = 1600
@@ -20,11 +41,16 @@ WINDOW_VERTICAL_MARGIN = 80
 WINDOW_CHROME_HEIGHT_ALLOWANCE = 100
 MAX_CONTENT_HEIGHT_SCREEN_FRACTION = 0.75
 CONTROL_BAR_HEIGHT = 48
-DEFAULT_PLOT_HEIGHT = 140
 MIN_PLOT_HEIGHT = 48
-
-ctrl_pressed = False
-event_key = None
+SNAP_WINDOW_SECONDS = 0.25
+PROXY_HEIGHT = 720
+CAMERA_MAX_LAG_SECONDS = 30.0
+
+input_queue = InputEventQueue()
+# Proxies are built one at a time in the background, across videos
+proxy_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='proxy')
+proxy_builds = {}
+proxy_stop = threading.Event()
 show_mode = 1 # 0=waveform, 1=spectrogram
 playback_speed = 100
 
@@ -33,41 +59,28 @@ def _on_mode_change(key):
     show_mode = int(key)
 
 def _on_press(key):
+    # Key codes match the values returned by cv2.waitKey
     try:
         if key in (keyboard.Key.ctrl_l, keyboard.Key.ctrl_r):
-            global ctrl_pressed
-            ctrl_pressed = True
-        else:
-            global event_key
-            if hasattr(key, 'char') and key.char is not None:
-                event_key = key.char
-            elif hasattr(key, 'vk'):
-                event_key = chr(key.vk)
+            input_queue.set_ctrl(True)
+        elif key == keyboard.Key.esc:
+            input_queue.listener_press(27)
+        elif key == keyboard.Key.space:
+            input_queue.listener_press(32)
+        elif hasattr(key, 'char') and key.char is not None and len(key.char) == 1 and key.char.isprintable():
+            input_queue.listener_press(ord(key.char))
+        elif getattr(key, 'vk', None) is not None:
+            input_queue.listener_press(key.vk)
     except Exception as e:
         print(f"Error in key press: {e}")
 
 def _on_release(key):
     try:
         if key in (keyboard.Key.ctrl_l, keyboard.Key.ctrl_r):
-            global ctrl_pressed
-            ctrl_pressed = False
-        else:
-            global event_key
-            event_key = None
+            input_queue.set_ctrl(False)
     except Exception as e:
         print(f"Error in key release: {e}")
 
-def read_wave(path):
-    sample_rate, x = wavfile.read(path)
-    x = x.T
-    if x.dtype == np.int32:
-        x = x / float(2**31-1)
-    elif x.dtype == np.int16:
-        x = x / float(2**15-1)
-    if len(x.shape) == 1:
-        x = x[None, :]
-    return sample_rate, x
-
 def get_screen_size(default=(1280, 720)):
     try:
         if os.name == 'nt':
@@ -116,7 +129,8 @@ def calculate_display_layout(video_width, video_height):
     aspect = video_width / max(1, video_height)
     min_plot_h = min(MIN_PLOT_HEIGHT, max(1, max_content_h // 4))
     plot_h = min(DEFAULT_PLOT_HEIGHT, max(min_plot_h, int(max_content_h * 0.12)))
-    available_video_h = max(1, max_content_h - 2 * plot_h - CONTROL_BAR_HEIGHT)
+    motion_h = max(1, plot_h // 2)
+    available_video_h = max(1, max_content_h - 2 * plot_h - motion_h - CONTROL_BAR_HEIGHT)
 
     target_w = min(video_width, max_content_w)
     target_h = int(round(target_w / aspect))
@@ -134,262 +148,178 @@ def calculate_display_layout(video_width, video_height):
         'plot_width': target_w,
         'waveform_height': plot_h,
         'velocity_height': plot_h,
+        'motion_height': motion_h,
         'control_height': CONTROL_BAR_HEIGHT,
         'content_width': target_w,
-        'content_height': target_h + CONTROL_BAR_HEIGHT + 2 * plot_h,
+        'content_height': target_h + CONTROL_BAR_HEIGHT + 2 * plot_h + motion_h,
     }
 
-def build_waveform_image(audio_signal, sr, width, height, audio_channel, bg=(24, 24, 24), fg=(230, 230, 230)):
-
-    img = np.full((height, width, 3), bg, dtype=np.uint8)
-
-    if audio_signal is None or sr is None:
-        cv2.putText(img, 'No audio data', (10, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-        return img
-
-    audio_signal = audio_signal[audio_channel, :]
-
-    samples_per_col = int(np.ceil(audio_signal.shape[0] / width))
-    mid_y = height // 2
-    cv2.line(img, (0, mid_y), (width - 1, mid_y), (100, 100, 100), 1)
-
-    for x in range(width):
-        s = x * samples_per_col
-        e = min((x + 1) * samples_per_col, audio_signal.shape[0])
-        if s >= e:
+@lru_cache(maxsize=None)
+def ffmpeg_frame_rate_option():
+    # -fps_mode replaced -vsync in ffmpeg 5.1, older versions only know -vsync
+    result = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    version = result.stdout.decode(errors='replace').split('\n', 1)[0]
+    match = re.match(r'ffmpeg version n?(\d+)\.(\d+)', version)
+    # Builds from git have no release number and are newer
+    if match is None or (int(match.group(1)), int(match.group(2))) >= (5, 1):
+        return "-fps_mode"
+    print(f"{version} does not support -fps_mode, falling back to -vsync")
+    return "-vsync"
+
+def proxy_is_current(input_path, proxy_path):
+    return os.path.exists(proxy_path) and os.path.getmtime(proxy_path) >= os.path.getmtime(input_path)
+
+def create_proxy_video(input_path, proxy_path, height=PROXY_HEIGHT, should_stop=None):
+    # Every frame is a keyframe, so any frame can be decoded on its own
+    if proxy_is_current(input_path, proxy_path):
+        return proxy_path
+
+    os.makedirs(os.path.dirname(proxy_path), exist_ok=True)
+    temp_output = proxy_path + "_tmp.mp4"
+    command_proxy = [
+        "ffmpeg", "-y", "-v", "error",
+        "-i", input_path,
+        "-an", "-vf", f"scale=-2:'min({height},ih)'", ffmpeg_frame_rate_option(), "passthrough",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-g", "1", "-pix_fmt", "yuv420p",
+        temp_output
+    ]
+    print(f"Creating proxy: {input_path} → {proxy_path}")
+    process = subprocess.Popen(command_proxy, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    while True:
+        try:
+            _, stderr = process.communicate(timeout=0.5)
             break
-
-        seg = audio_signal[s:e]
-        min_val = np.min(seg)
-        max_val = np.max(seg)
-
-        y_min = int((1 - max_val) * 0.5 * (height - 1))
-        y_max = int((1 - min_val) * 0.5 * (height - 1))
-        cv2.line(img, (x, y_min), (x, y_max), fg, 1)
-
-    return img
-
-def build_spectrogram_image(audio_signal, sr, width, height, audio_channel,
-                            bg=(24, 24, 24),
-                            nfft=1024, noverlap=768, max_freq=None):
-    if audio_signal is None or sr is None:
-        img = np.full((height, width, 3), bg, dtype=np.uint8)
-        cv2.putText(img, 'No audio data', (10, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-        return img
-
-    x = audio_signal[audio_channel, :].astype(np.float32)
-
-    dpi = 100
-    fig_w = max(1, int(width)) / dpi
-    fig_h = max(1, int(height)) / dpi
-    fig = plt.Figure(figsize=(fig_w, fig_h), dpi=dpi)
-    canvas = FigureCanvasAgg(fig)
-    ax = fig.add_axes([0, 0, 1, 1])
-
-    fig.patch.set_facecolor(np.array(bg) / 255.0)
-    ax.set_facecolor(np.array(bg) / 255.0)
-
-    Pxx, freqs, bins, im = ax.specgram(
-        x,
-        NFFT=nfft,
-        Fs=sr,
-        noverlap=noverlap,
-        scale='dB',
-        mode='psd',
-        window=np.hanning(nfft),
-        cmap='magma'
-    )
-
-    db = 10.0 * np.log10(Pxx + 1e-12)
-
-    vmax = np.percentile(db, 99.5)
-    vmin = vmax - 80.0
-    im.set_clim(vmin, vmax)
-
-    if max_freq is not None:
-        ax.set_ylim(0, max_freq)
-    else:
-        ax.set_ylim(0, sr / 2)
-
-    ax.set_axis_off()
-
-    canvas.draw()
-    buf = np.frombuffer(canvas.buffer_rgba(), dtype=np.uint8)
-    img_rgba = buf.reshape(int(height), int(width), 4)
-    img_bgr = cv2.cvtColor(img_rgba, cv2.COLOR_RGBA2BGR)
-
-    return img_bgr
-
-def draw_playhead(img, position, max_position):
-    h, w = img.shape[:2]
-    
-    position = float(position)
-    x = int((position / float(max_position)) * (w - 1))
-    x = max(0, min(w - 1, x))
-    cv2.line(img, (x, 0), (x, h - 1), (0, 180, 255), 1)
-    return img
-
-
-def build_velocity_image(labelled_positions_path, width, height, bg=(255, 255, 255), line=(255, 0, 0), axis=(200, 200, 200)):
-    img = np.full((height, width, 3), bg, dtype=np.uint8)
-
-    if not labelled_positions_path or not os.path.exists(labelled_positions_path):
-        cv2.putText(img, 'No velocity data', (10, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-        return img
-    
-    df = pd.read_csv(labelled_positions_path)
-
-    # Required check because of legacy files
-    if 'velocity_cm/s' in df.columns:
-        df['velocity'] = df['velocity_cm/s']
-
-    velocity_original = df['velocity'].copy()
-    df['velocity'] = df['velocity'].rolling(window=3, center=True).mean()
-    df['velocity'] = df['velocity'].fillna(velocity_original)
-
-    frames = df['Frame'].to_numpy(dtype=np.int64)
-    velocities = df['velocity'].fillna(0).to_numpy(dtype=np.float32)
-
-    v_max = np.nanmax(velocities)
-    v_min = np.nanmin(velocities)
-    v_abs_max = float(np.nanmax(np.abs(velocities)))
-    v_norm = np.clip(velocities / v_abs_max, -1.0, 1.0)
-
-    total_frames = frames.shape[0]
-    pts = []
-    for frame, val in zip(frames, v_norm):
-        x = int((frame - 1) * (width - 1) / max(1, total_frames - 1))
-        y = int((1 - (val + 1) / 2) * (height - 1))
-        pts.append((x, y))
-
-    cv2.line(img, (0, height // 2), (width - 1, height // 2), axis, 1)
-
-    cv2.polylines(img, [np.array(pts, dtype=np.int32)], False, line, 1)
-
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    font_scale = 0.3
-    font_color = (50, 100, 50)
-    thickness = 1
-    margin_left = 5
-
-    label_top = f"{v_max:.1f} cm/s"
-    label_center = "0 cm/s"
-    label_bottom = f"{v_min:.1f} cm/s"
-
-    cv2.putText(img, label_top, (margin_left, 15), font, font_scale, font_color, thickness)
-    cv2.putText(img, label_center, (margin_left, height // 2 - 5), font, font_scale, font_color, thickness)
-    cv2.putText(img, label_bottom, (margin_left, height - 5), font, font_scale, font_color, thickness)
-
-    return img
-
-def durations_match(total_frames, audio_sr, audio_signal, eps=0.1):
-
-    video_duration = total_frames / 30.0
-    audio_duration = audio_signal.shape[1] / audio_sr
-    print(abs(video_duration - audio_duration))
-
-    return abs(video_duration - audio_duration) < eps
-
-def convert_video_to_h264(input_path):
-    
-    command_check = [
+        except subprocess.TimeoutExpired:
+            if should_stop is not None and should_stop():
+                process.kill()
+                process.communicate()
+                if os.path.exists(temp_output):
+                    os.remove(temp_output)
+                return None
+
+    if process.returncode == 0 and os.path.exists(temp_output):
+        os.replace(temp_output, proxy_path)
+        return proxy_path
+    print(f"Error creating proxy for {input_path}:\n{stderr.decode()}")
+    if os.path.exists(temp_output):
+        os.remove(temp_output)
+    return None
+
+def build_proxy_in_background(input_path, proxy_path):
+    # One build per proxy, shared when the video is opened again before it is done
+    future = proxy_builds.get(proxy_path)
+    if future is None or future.done():
+        future = proxy_executor.submit(create_proxy_video, input_path, proxy_path, should_stop=proxy_stop.is_set)
+        proxy_builds[proxy_path] = future
+    return future
+
+def probe_start_time(input_path):
+    command = [
         "ffprobe",
         "-v", "error",
-        "-select_streams", "v:0",
-        "-show_entries", "stream=codec_name",
+        "-show_entries", "format=start_time",
         "-of", "default=noprint_wrappers=1:nokey=1",
         input_path
     ]
-    result = subprocess.run(command_check, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    codec = result.stdout.decode().strip()
-    
-    if codec == "h264":
-        print(f"{input_path} is already H.264, skipping conversion.")
-        return input_path
-
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        return float(result.stdout.decode().strip())
+    except ValueError:
+        return 0.0
 
-    temp_output = input_path + "_tmp.mp4"
-    command_convert = [
-        "ffmpeg", "-y",
-        "-i", input_path,
-        "-c:v", "libx264", "-preset", "slow", "-crf", "23",
-        "-c:a", "aac", "-b:a", "128k",
-        temp_output
+def probe_creation_time(input_path):
+    # Recording start from the container tags as a POSIX timestamp, or None
+    command = [
+        "ffprobe",
+        "-v", "error",
+        "-show_entries", "format_tags=creation_time",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        input_path
     ]
-    print(f"Converting: {input_path} → H.264")
-    result = subprocess.run(command_convert, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-    if os.path.exists(temp_output):
-        os.replace(temp_output, input_path)
-        print(f"Conversion done: {input_path}")
-        return input_path
-    else:
-        print(f"Error converting {input_path}:\n{result.stderr.decode()}")
-        return input_path
-
-    
-def get_json_filename(video_filename):
-    base_name = os.path.splitext(video_filename)[0]
-    base_name_lower = base_name.lower()
-
-    if "cam1" in base_name_lower:
-        base_name = base_name_lower.replace("cam1", "")
-    elif "cam2" in base_name_lower:
-        base_name = base_name_lower.replace("cam2", "")
-
-    base_name = base_name.strip(" _-")
-    return base_name + ".json"
-
-def merge_annotations(video_path, new_annotations, audio_path, should_update_audio):
-    original_video_file = os.path.basename(video_path)
-    json_filename = get_json_filename(original_video_file)
-
-    parent_folder = os.path.dirname(os.path.dirname(video_path))
-    annotations_folder = os.path.join(parent_folder, "annotations")
-    json_path = os.path.join(annotations_folder, json_filename)
-
-    existing_data = {}
-    if os.path.exists(json_path):
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    value = result.stdout.decode().strip()
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+def estimate_camera_offset(primary_path, secondary_path):
+    # Offset in seconds of the secondary stream start relative to the primary one
+    name = os.path.basename(secondary_path)
+    track_lag = estimate_track_lag(primary_path, secondary_path, CAMERA_MAX_LAG_SECONDS)
+    if track_lag is not None:
+        # The secondary shows primary time t at its own time t + lag, i.e. it started -lag later
+        offset = -track_lag[0]
+        print(f"Camera offset of {name}: {offset:.3f}s from audio cross-correlation (score {track_lag[1]:.2f})")
+        return offset
+
+    created = probe_creation_time(primary_path), probe_creation_time(secondary_path)
+    if None not in created:
+        offset = created[1] - created[0]
+        print(f"Camera offset of {name}: {offset:.3f}s from creation times (1 s resolution on most cameras)")
+        return offset
+
+    offset = probe_start_time(secondary_path) - probe_start_time(primary_path)
+    if offset != 0.0:
+        print(f"Camera offset of {name}: {offset:.3f}s from container start times")
+        return offset
+
+    print(f"Could not determine the camera offset of {name}, assuming 0 s. Use --camera-offset to set it.")
+    return 0.0
+
+def read_camera_offset(json_path, primary_path, secondary_path):
+    # Offset saved with earlier annotations of the same camera pair, or None
+    if not os.path.exists(json_path):
+        return None
+    try:
         with open(json_path, 'r', encoding='utf-8') as f:
-            existing_data = json.load(f)
-
-    existing_data["video_file"] = original_video_file
-    if should_update_audio:
-        existing_data['audio_file'] = os.path.basename(audio_path)
-        
-    if "video_annotations" not in existing_data:
-        existing_data["video_annotations"] = {}
-    if "audio_annotations" not in existing_data and should_update_audio:
-        existing_data["audio_annotations"] = {}
-
-    for k, v in new_annotations.items():
-        if v["frame"] is not None and v["time"] is not None:
-            existing_data["video_annotations"][k] = {"time": v["time"], "frame": v["frame"]}
-
-        if v['sample'] is not None and should_update_audio:
-            existing_data["audio_annotations"][k] = {"time": v["time"], "sample": int(v["sample"])}
-
-    os.makedirs(annotations_folder, exist_ok=True)
-
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(existing_data, f, indent=4)
-        print(f"Annotations for {video_path} updated in {json_path}.")
-
-def update_annotations(annotations, event_number, annotation):
-    print(f"Event {event_number} annotated at frame {annotation[0]}, time {annotation[1]:.2f}s")
-    frame = annotation[0]
-    time = annotation[1]
-    sample = time * annotation[2] if annotation[2] is not None else None
-    annotations[str(event_number)] = {
-        "frame": frame,
-        "time": time,
-        "sample": sample
-    }
+            camera_sync = json.load(f).get("camera_sync") or {}
+    except (OSError, ValueError) as e:
+        print(f"Error reading {json_path}: {e}")
+        return None
+    if camera_sync.get("video_files") != [os.path.basename(primary_path), os.path.basename(secondary_path)]:
+        return None
+    return camera_sync.get("offset")
+
+def camera_frame_index(stream, time_in_seconds, offset):
+    index = int(round((time_in_seconds - offset) * stream.fps))
+    return max(0, min(index, max(0, stream.frame_count - 1)))
+
+def read_motion_cache(motion_path):
+    # Returns (motion, roi, source_mtime) or None
+    if not os.path.exists(motion_path):
+        return None
+    try:
+        with np.load(motion_path) as cached:
+            roi = tuple(float(v) for v in cached["roi"]) or None
+            return cached["motion"], roi, float(cached["source_mtime"])
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ignoring motion cache {motion_path}: {e}")
+        return None
+
+def get_motion_index(video_path, motion_source, roi=None, video_root=None, should_stop=None):
+    # motion_source is the file that is decoded, e.g. the proxy, the cache is tied to video_path
+    motion_path = get_motion_path(video_path, video_root)
+    source_mtime = os.path.getmtime(video_path)
+    cached = read_motion_cache(motion_path)
+    if cached is not None and cached[1] == roi and cached[2] == source_mtime:
+        return cached[0]
+
+    motion = compute_motion_index(motion_source, roi, should_stop=should_stop)
+    if motion is None or (should_stop is not None and should_stop()):
+        return None
+
+    os.makedirs(os.path.dirname(motion_path), exist_ok=True)
+    np.savez(motion_path, motion=motion, roi=np.asarray(roi or (), dtype=np.float64), source_mtime=source_mtime)
+    return motion
 
 zoom_level = 1.0
 zoom_center = None
+audio_zoom_level = 0
+audio_zoom_max = 0
 last_frame = None
 display_video_size = None
+secondary_display_video_size = None
 source_video_size = None
 control_regions = {}
 speed_slider_dragging = False
@@ -456,33 +386,9 @@ def build_control_bar(width, height, top_y):
         'speed_slider': speed_rect,
     }
 
-def get_zoomed_frame(frame, zoom_level, center=None, output_size=None):
-    h, w = frame.shape[:2]
-
-    if zoom_level <= 1.0:
-        if output_size is None or output_size == (w, h):
-            return frame
-        interpolation = cv2.INTER_AREA if output_size[0] < w or output_size[1] < h else cv2.INTER_LINEAR
-        return cv2.resize(frame, output_size, interpolation=interpolation)
-
-    new_w = int(w / zoom_level)
-    new_h = int(h / zoom_level)
-
-    if center is None:
-        center_x, center_y = w // 2, h // 2
-    else:
-        center_x, center_y = center
-
-    x1 = max(center_x - new_w // 2, 0)
-    y1 = max(center_y - new_h // 2, 0)
-    x2 = min(x1 + new_w, w)
-    y2 = min(y1 + new_h, h)
-
-    cropped = frame[y1:y2, x1:x2]
-    output_size = output_size or (w, h)
-    zoomed_frame = cv2.resize(cropped, output_size, interpolation=cv2.INTER_LINEAR)
-
-    return zoomed_frame
+def _change_audio_zoom(step):
+    global audio_zoom_level
+    audio_zoom_level = max(0, min(audio_zoom_max, audio_zoom_level + step))
 
 def mouse_callback(event, x, y, flags, param):
     global zoom_level, zoom_center, last_frame, show_mode, speed_slider_dragging
@@ -512,6 +418,10 @@ def mouse_callback(event, x, y, flags, param):
         speed_slider_dragging = False
         return
 
+    if event == cv2.EVENT_MOUSEWHEEL and control_regions.get('audio_panel') and _point_in_rect(x, y, control_regions['audio_panel']):
+        _change_audio_zoom(1 if flags > 0 else -1)
+        return
+
     if event == cv2.EVENT_MOUSEWHEEL and display_video_size and y < display_video_size[1]:
         if flags > 0:  # Scroll up
             zoom_level = min(zoom_level + 0.2, 5.0)
@@ -520,6 +430,11 @@ def mouse_callback(event, x, y, flags, param):
         if display_video_size and source_video_size:
             display_w, display_h = display_video_size
             source_w, source_h = source_video_size
+            if x >= display_w and secondary_display_video_size:
+                # Secondary camera shown to the right of the primary one. The centre is kept as the same fraction
+                # of the frame in primary coordinates, which the secondary view maps back to its own size
+                x -= display_w
+                display_w, display_h = secondary_display_video_size
             if 0 <= x < display_w and 0 <= y < display_h:
                 zoom_center = (
                     int(x * source_w / max(1, display_w)),
@@ -531,15 +446,69 @@ def mouse_callback(event, x, y, flags, param):
         if last_frame is not None:
             get_zoomed_frame(last_frame, zoom_level, zoom_center, display_video_size)
 
-def annotate_video(video_path, audio_path, labelled_position_path, audio_channel):
-    global zoom_level, zoom_center, last_frame, ctrl_pressed, event_key, display_video_size, source_video_size, control_regions
+def open_video(mp4_path, proxy_path, history_codec='jpg'):
+    # Returns the stream to navigate on, with a proxy a reader for the original frames, and a proxy build that is
+    # still running. Until that build is done, the original is used
+    if proxy_path is None:
+        return VideoStream(mp4_path, history_codec=history_codec), None, None
+    if proxy_is_current(mp4_path, proxy_path):
+        return VideoStream(proxy_path, history_codec=history_codec, seekable=True), FrameReader(mp4_path), None
+    return VideoStream(mp4_path, history_codec=history_codec), None, build_proxy_in_background(mp4_path, proxy_path)
+
+def switch_to_proxy(stream, full, pending, history_codec='jpg'):
+    # Moves navigation from the original to the proxy once its background build is done
+    if pending is None or not pending.done():
+        return stream, full, pending
+    try:
+        proxy_path = pending.result()
+    except Exception as e:
+        print(f"Error creating proxy for {stream.path}: {e}")
+        return stream, full, None
+    if proxy_path is None:
+        return stream, full, None
+
+    proxy_stream = VideoStream(proxy_path, history_codec=history_codec, seekable=True)
+    if not proxy_stream.is_opened() or proxy_stream.frame_count != stream.frame_count:
+        print(f"Proxy {proxy_path} does not match {stream.path}, staying on the original.")
+        proxy_stream.close()
+        return stream, full, None
+    print(f"Proxy ready, navigating on {proxy_path}")
+    stream.close()
+    return proxy_stream, FrameReader(stream.path), None
+
+def annotate_video(video_path, audio_path, labelled_position_path, audio_channel, secondary_video_path=None, camera_offset=None, video_root=None,
+                   history_codec='jpg', proxy=False):
+    global zoom_level, zoom_center, last_frame, display_video_size, source_video_size, control_regions
+    global audio_zoom_level, audio_zoom_max
+    global secondary_display_video_size
+    if secondary_video_path is not None and camera_offset is None:
+        camera_offset = read_camera_offset(get_json_path(video_path, video_root), video_path, secondary_video_path)
+        if camera_offset is not None:
+            print(f"Camera offset of {os.path.basename(secondary_video_path)}: {camera_offset:.3f}s from the annotation file")
+        else:
+            camera_offset = estimate_camera_offset(video_path, secondary_video_path)
+
     mp4_path = convert_video_to_h264(video_path)
-    cap = cv2.VideoCapture(mp4_path)
+    stream, full, proxy_pending = open_video(mp4_path, get_proxy_path(video_path, video_root) if proxy else None, history_codec)
 
-    if not cap.isOpened():
+    if not stream.is_opened():
         print("Error: Could not open video.")
         return
-    
+
+    secondary = None
+    secondary_full = None
+    secondary_proxy_pending = None
+    if secondary_video_path is not None:
+        secondary, secondary_full, secondary_proxy_pending = open_video(convert_video_to_h264(secondary_video_path),
+                                               get_proxy_path(secondary_video_path, video_root) if proxy else None, history_codec)
+        if secondary.is_opened():
+            print(f"Synchronized with {os.path.basename(secondary_video_path)}, offset {camera_offset:.3f}s")
+        else:
+            print(f"Error: Could not open video {secondary_video_path}.")
+            secondary.close()
+            secondary = None
+            secondary_proxy_pending = None
+
     audio_sr = None
     audio_data = None
     audio_duration = 0.0
@@ -558,22 +527,20 @@ def annotate_video(video_path, audio_path, labelled_position_path, audio_channel
     annotations = {}
     e1_frame = e2_frame = e3_frame = e4_frame = e5_frame = e6_frame = e7_frame = e8_frame = None
     paused = False
-    frame_buffer = []
     buf_i = -1
-    key_pressed = None
     quit_app = False
     go_prev = False
 
-    json_filename = get_json_filename(os.path.basename(video_path))
-    parent_folder = os.path.dirname(os.path.dirname(video_path))
-    annotations_folder = os.path.join(parent_folder, "annotations")
-    json_path = os.path.join(annotations_folder, json_filename)
+    json_path = get_json_path(video_path, video_root)
     existing_annotations_title = ""
     video_existing_annotations = {}
+    audio_sync = None
 
     if os.path.exists(json_path):
         with open(json_path, 'r', encoding='utf-8') as f:
             existing_data = json.load(f)
+            if audio_path and existing_data.get("audio_file") == os.path.basename(audio_path):
+                audio_sync = existing_data.get("audio_sync")
             if "video_annotations" in existing_data:
                 video_existing_annotations = existing_data["video_annotations"]
                 existing_annotations_title = " | Existing :"
@@ -584,21 +551,75 @@ def annotate_video(video_path, audio_path, labelled_position_path, audio_channel
                         existing_annotations_title += f" {key}: F(T): {frame}({time:.2f}s)"
 
 
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    fps = stream.fps
     buf_i = 0
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    vh, vw = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)))
-    layout = calculate_display_layout(vw, vh)
-    display_video_size = (layout['video_width'], layout['video_height'])
+    total_frames = stream.frame_count
+    # Zoom centres are in original video coordinates, also when navigating on a proxy
+    vw, vh = full.size if full is not None else stream.size
+    if secondary is not None:
+        # Both cameras side by side at the same height
+        vw2, vh2 = secondary.size
+        layout = calculate_display_layout(vw + int(round(vw2 * vh / max(1, vh2))), vh)
+        primary_w = int(round(layout['video_height'] * vw / max(1, vh)))
+        secondary_display_size = (max(1, layout['video_width'] - primary_w), layout['video_height'])
+        display_video_size = (primary_w, layout['video_height'])
+        secondary_display_video_size = secondary_display_size
+    else:
+        layout = calculate_display_layout(vw, vh)
+        display_video_size = (layout['video_width'], layout['video_height'])
+        secondary_display_video_size = None
     source_video_size = (vw, vh)
     waveform_h = layout['waveform_height']
     velocity_h = layout['velocity_height']
+    motion_h = layout['motion_height']
     control_h = layout['control_height']
     plot_w = layout['plot_width']
 
-    base_waveform = build_waveform_image(audio_data, audio_sr, plot_w, waveform_h, audio_channel)
-    base_spectrogram = build_spectrogram_image(audio_data, audio_sr, plot_w, waveform_h, audio_channel, nfft=512, noverlap=384, max_freq=None)
-    velocity_plot = build_velocity_image(labelled_position_path, plot_w, velocity_h)
+    if audio_data is not None:
+        n_channels = audio_data.shape[0]
+        if not 0 <= audio_channel < n_channels:
+            print(f"Audio channel {audio_channel} not available, using channel 0 of {n_channels}")
+            audio_channel = 0
+        channel_panels = build_channel_panels(audio_data, audio_sr, plot_w, waveform_h, nfft=512, noverlap=384, max_freq=None)
+    else:
+        n_channels = 0
+        channel_panels = [{
+            'waveform': build_waveform_image(audio_data, audio_sr, plot_w, waveform_h, audio_channel),
+            'spectrogram': build_spectrogram_image(audio_data, audio_sr, plot_w, waveform_h, audio_channel),
+        }]
+        audio_channel = 0
+    velocity_plot = build_velocity_image(labelled_position_path, plot_w, velocity_h, total_frames=total_frames)
+
+    # The audio track is extracted and cross-correlated with the WAV while annotating
+    sync_executor = ThreadPoolExecutor(max_workers=1)
+    sync_future = None
+    if audio_data is not None and audio_sync is None:
+        sync_future = sync_executor.submit(estimate_av_sync, mp4_path, audio_data, audio_sr, fps, total_frames)
+
+    audio_tiles = None
+    audio_zoom_level = 0
+    audio_zoom_max = 0
+    if audio_data is not None:
+        audio_tiles = AudioTileCache(audio_data, audio_sr, plot_w, waveform_h)
+        audio_zoom_max = audio_tiles.max_level
+
+    # Motion energy is computed in the background and cached per video together with the selected ROI
+    motion_executor = ThreadPoolExecutor(max_workers=1)
+    motion_stop = threading.Event()
+    cached_motion = read_motion_cache(get_motion_path(video_path, video_root))
+    motion_roi = cached_motion[1] if cached_motion is not None else None
+    motion_future = motion_executor.submit(get_motion_index, mp4_path, stream.path, motion_roi, video_root, motion_stop.is_set)
+    motion_plot = build_motion_image(None, plot_w, motion_h)
+    motion_onsets = []
+    motion_stops = []
+
+    candidates = get_event_candidates(video_path, audio_path, labelled_position_path, fps, audio_sr, audio_data, video_root)
+    snap_enabled = False
+    snap_distance = max(1, int(round(SNAP_WINDOW_SECONDS * fps)))
+
+    display_log = DisplayLog()
+    input_queue.clear()
+    leave = False
 
     audio_player = AudioPlayer(audio_data, audio_sr, audio_channel)
     audio_player.play(0)
@@ -609,46 +630,90 @@ def annotate_video(video_path, audio_path, labelled_position_path, audio_channel
             quit_app = True
             break
 
-        if not frame_buffer:
-            ret, frame = cap.read()
-            if not ret:
-                paused = True
-                continue
-            frame_buffer.append(frame)
+        if proxy_pending is not None:
+            stream, full, proxy_pending = switch_to_proxy(stream, full, proxy_pending, history_codec)
+        if secondary_proxy_pending is not None:
+            secondary, secondary_full, secondary_proxy_pending = switch_to_proxy(secondary, secondary_full,
+                                                                                 secondary_proxy_pending, history_codec)
 
         if not paused:
-            if buf_i < len(frame_buffer) - 1:
+            if stream.get(buf_i + 1) is not None:
                 buf_i += 1
             else:
-                ret, frame = cap.read()
-                if not ret:
-                    paused = True
-                else:
-                    frame_buffer.append(frame)
-                    buf_i += 1
+                paused = True
 
-        frame = frame_buffer[buf_i]
+        frame = stream.get(buf_i)
+        if frame is None:
+            print("Error: Could not read video.")
+            break
+        if full is not None and zoom_level > 1.0:
+            # The proxy is only used for navigation, zoomed views show the exact original frame
+            frame = full.get(buf_i, frame)
         last_frame = frame.copy()
 
         frame_index = buf_i
         time_in_seconds = frame_index / fps
 
         display_frame = get_zoomed_frame(frame, zoom_level, zoom_center, display_video_size)
-
-        if show_mode == 0:
-            sp = base_waveform.copy()
+        if secondary is not None:
+            secondary_index = camera_frame_index(secondary, time_in_seconds, camera_offset)
+            secondary_frame = secondary.get(secondary_index)
+            if secondary_frame is not None and secondary_full is not None and zoom_level > 1.0:
+                secondary_frame = secondary_full.get(secondary_index, secondary_frame)
+            if secondary_frame is None:
+                secondary_view = np.zeros((secondary_display_size[1], secondary_display_size[0], 3), dtype=np.uint8)
+            else:
+                secondary_center = None
+                if zoom_center is not None:
+                    secondary_center = (int(zoom_center[0] * secondary_frame.shape[1] / max(1, vw)),
+                                        int(zoom_center[1] * secondary_frame.shape[0] / max(1, vh)))
+                secondary_view = get_zoomed_frame(secondary_frame, zoom_level, secondary_center, secondary_display_size)
+            display_frame = np.hstack([display_frame, secondary_view])
+
+        if audio_tiles is not None and audio_zoom_level > 0:
+            sp, view_start, view_duration = audio_tiles.render_view(time_in_seconds, audio_zoom_level, show_mode, audio_channel)
+            draw_candidate_markers(sp, candidates, 'time', view_start, view_duration)
+            draw_playhead(sp, time_in_seconds - view_start, view_duration)
+            draw_zoom_label(sp, 2 ** audio_zoom_level)
         else:
-            sp = base_spectrogram.copy()
-        if audio_duration > 0:
-            draw_playhead(sp, time_in_seconds, audio_duration)
+            if show_mode == 0:
+                sp = channel_panels[audio_channel]['waveform'].copy()
+            else:
+                sp = channel_panels[audio_channel]['spectrogram'].copy()
+            if audio_duration > 0:
+                draw_candidate_markers(sp, candidates, 'time', 0.0, audio_duration)
+                draw_playhead(sp, time_in_seconds, audio_duration)
         vel = velocity_plot.copy()
+        draw_candidate_markers(vel, candidates, 'frame', 0, total_frames - 1)
         if labelled_position_path and os.path.exists(labelled_position_path):
             draw_playhead(vel, frame_index, total_frames - 1)
 
+        if motion_future is not None and motion_future.done():
+            try:
+                motion = motion_future.result()
+            except Exception as e:
+                print(f"Error computing motion index: {e}")
+                motion = None
+            motion_future = None
+            onsets, stops = motion_events(motion, fps)
+            motion_onsets = [{'frame': f} for f in onsets]
+            motion_stops = [{'frame': f} for f in stops]
+            motion_plot = build_motion_image(motion, plot_w, motion_h, onsets, stops)
+        mot = motion_plot.copy()
+        draw_playhead(mot, frame_index, total_frames - 1)
+
         controls, control_regions = build_control_bar(plot_w, control_h, display_frame.shape[0])
-        combined = np.vstack([display_frame, controls, sp, vel])
+        audio_top = display_frame.shape[0] + control_h
+        control_regions['audio_panel'] = (0, audio_top, plot_w - 1, audio_top + waveform_h - 1)
+        combined = np.vstack([display_frame, controls, sp, vel, mot])
 
         title_text = f'{os.path.basename(video_path)} | {frame_index}({time_in_seconds:.2f}s){existing_annotations_title}'
+        if n_channels > 1:
+            title_text += f' | Ch {audio_channel}/{n_channels}'
+        if secondary is not None:
+            title_text += f' | {os.path.basename(secondary_video_path)}: {secondary_index}'
+        if snap_enabled:
+            title_text += ' | SNAP'
         if e1_frame is not None:
             title_text += f' | New : E1 F(T): {e1_frame}({e1_time:.2f}s)'
         if e2_frame is not None and e1_frame is not None and e1_frame<e2_frame:
@@ -670,129 +735,209 @@ def annotate_video(video_path, audio_path, labelled_position_path, audio_channel
         cv2.imshow(WINDOW_NAME, combined)
         speed_val = max(1, playback_speed)
         wait_ms = int(33 / (speed_val / 100.0))
+        display_log.shown(frame_index)
         key = cv2.waitKey(wait_ms)
+        if key != -1:
+            input_queue.window_key(key)
 
-        if key == 27:  # ESC
-            quit_app = True
-            break
-        elif key == 32:  # Space pause/play
-            paused = not paused
-            if paused:
+        # Every press is applied to the frame that was on screen when it happened
+        for event in input_queue.drain():
+            key = event.key
+            if event.ctrl and not ord('1') <= key <= ord('8'):
+                continue
+            frame_index = display_log.frame_at(event.timestamp)
+            time_in_seconds = frame_index / fps
+
+            mark_frame, mark_time = frame_index, time_in_seconds
+            if snap_enabled and ord('1') <= key <= ord('8'):
+                snapped = nearest_candidate(candidates, frame_index, snap_distance)
+                if snapped is not None:
+                    mark_frame, mark_time = snapped['frame'], snapped['frame'] / fps
+
+            if key == 27:  # ESC
+                quit_app = True
+                leave = True
+                break
+            elif key == 32:  # Space pause/play
+                paused = not paused
+                if paused:
+                    buf_i = frame_index
+                    audio_player.pause()
+                    audio_player.seek(buf_i / fps)
+                else:
+                    audio_player.play(buf_i / fps)
+            elif key == ord('r'):  # Reset zoom
+                zoom_level = 1.0
+                zoom_center = None
+            elif key == ord('m') and n_channels > 1:  # Switch audio channel
+                audio_channel = (audio_channel + 1) % n_channels
+                audio_player.set_channel(audio_channel)
+            elif key == ord('s'):  # Toggle snapping events to candidates
+                snap_enabled = not snap_enabled
+            elif key in (ord(']'), ord('[')):  # Jump to next/previous candidate
+                target = next_candidate(candidates, frame_index, 1 if key == ord(']') else -1)
+                if target is not None:
+                    paused = True
+                    audio_player.pause()
+                    buf_i = stream.last_index(target['frame'])
+                    audio_player.seek(buf_i / fps)
+            elif key in (ord('.'), ord(','), ord('>'), ord('<')):  # Jump to next/previous motion onset/stop
+                marks = motion_onsets if key in (ord('.'), ord(',')) else motion_stops
+                target = next_candidate(marks, frame_index, 1 if key in (ord('.'), ord('>')) else -1)
+                if target is not None:
+                    paused = True
+                    audio_player.pause()
+                    buf_i = stream.last_index(target['frame'])
+                    audio_player.seek(buf_i / fps)
+            elif key == ord('o'):  # Select the motion ROI, an empty selection uses the whole frame
+                paused = True
                 audio_player.pause()
-            else:
-                audio_player.play(time_in_seconds)
-        elif key == ord('r'):  # Reset zoom
-            zoom_level = 1.0
-            zoom_center = None
-        elif key == ord('1') and not ctrl_pressed:
-            e1_frame = frame_index; e1_time = time_in_seconds
-            if e2_frame is not None and e1_frame > e2_frame:
-                e2_frame = e3_frame = e4_frame = e5_frame = e6_frame = e7_frame = e8_frame = None
-            update_annotations(annotations, 1, (e1_frame, e1_time, audio_sr))
-        elif key == ord('2') and not ctrl_pressed and e1_frame is not None:
-            e2_frame = frame_index; e2_time = time_in_seconds
-            if e2_frame < e1_frame:
-                e2_frame = e3_frame = e4_frame = e5_frame = e6_frame = e7_frame = e8_frame = None
-            update_annotations(annotations, 2, (e2_frame, e2_time, audio_sr))
-        elif key == ord('3') and not ctrl_pressed and e2_frame is not None:
-            e3_frame = frame_index; e3_time = time_in_seconds
-            if e3_frame < e2_frame:
-                e3_frame = e4_frame = e5_frame = e6_frame = e7_frame = e8_frame = None
-            update_annotations(annotations, 3, (e3_frame, e3_time, audio_sr))
-        elif key == ord('4') and not ctrl_pressed and e3_frame is not None:
-            e4_frame = frame_index; e4_time = time_in_seconds
-            if e4_frame < e3_frame:
-                e4_frame = e5_frame = e6_frame = e7_frame = e8_frame = None
-            update_annotations(annotations, 4, (e4_frame, e4_time, audio_sr))
-        elif key == ord('5') and not ctrl_pressed and e4_frame is not None:
-            e5_frame = frame_index; e5_time = time_in_seconds
-            if e5_frame < e4_frame:
-                e5_frame = e6_frame = e7_frame = e8_frame = None
-            update_annotations(annotations, 5, (e5_frame, e5_time, audio_sr))
-        elif key == ord('6') and not ctrl_pressed and e5_frame is not None:
-            e6_frame = frame_index; e6_time = time_in_seconds
-            if e6_frame < e5_frame:
-                e6_frame = e7_frame = e8_frame = None
-            update_annotations(annotations, 6, (e6_frame, e6_time, audio_sr))
-        elif key == ord('7') and not ctrl_pressed and e6_frame is not None:
-            e7_frame = frame_index; e7_time = time_in_seconds
-            if e7_frame < e6_frame:
-                e7_frame = e8_frame = None
-            update_annotations(annotations, 7, (e7_frame, e7_time, audio_sr))
-        elif key == ord('8') and not ctrl_pressed and e7_frame is not None:
-            e8_frame = frame_index; e8_time = time_in_seconds
-            if e8_frame < e7_frame:
-                e8_frame = None
-            update_annotations(annotations, 8, (e8_frame, e8_time, audio_sr))
-
-        elif event_key == '1' and ctrl_pressed and "1" in video_existing_annotations:
-            print("Restoring event 1 from existing annotations")
-            e1_frame = video_existing_annotations["1"]["frame"]; e1_time = video_existing_annotations["1"]["time"]
-            update_annotations(annotations, 1, (e1_frame, e1_time, audio_sr))
-        elif event_key == '2' and ctrl_pressed and "2" in video_existing_annotations:
-            e2_frame = video_existing_annotations["2"]["frame"]; e2_time = video_existing_annotations["2"]["time"]
-            update_annotations(annotations, 2, (e2_frame, e2_time, audio_sr))
-        elif event_key == '3' and ctrl_pressed and "3" in video_existing_annotations:
-            e3_frame = video_existing_annotations["3"]["frame"]; e3_time = video_existing_annotations["3"]["time"]
-            update_annotations(annotations, 3, (e3_frame, e3_time, audio_sr))
-        elif event_key == '4' and ctrl_pressed and "4" in video_existing_annotations:
-            e4_frame = video_existing_annotations["4"]["frame"]; e4_time = video_existing_annotations["4"]["time"]
-            update_annotations(annotations, 4, (e4_frame, e4_time, audio_sr))
-        elif event_key == '5' and ctrl_pressed and "5" in video_existing_annotations:
-            e5_frame = video_existing_annotations["5"]["frame"]; e5_time = video_existing_annotations["5"]["time"]
-            update_annotations(annotations, 5, (e5_frame, e5_time, audio_sr))
-        elif event_key == '6' and ctrl_pressed and "6" in video_existing_annotations:
-            e6_frame = video_existing_annotations["6"]["frame"]; e6_time = video_existing_annotations["6"]["time"]
-            update_annotations(annotations, 6, (e6_frame, e6_time, audio_sr))
-        elif event_key == '7' and ctrl_pressed and "7" in video_existing_annotations:
-            e7_frame = video_existing_annotations["7"]["frame"]; e7_time = video_existing_annotations["7"]["time"]
-            update_annotations(annotations, 7, (e7_frame, e7_time, audio_sr))
-        elif event_key == '8' and ctrl_pressed and "8" in video_existing_annotations:
-            e8_frame = video_existing_annotations["8"]["frame"]; e8_time = video_existing_annotations["8"]["time"]
-            update_annotations(annotations, 8, (e8_frame, e8_time, audio_sr))
-        elif key == ord('n'):
-            break
-        elif key == ord('p'):
-            go_prev = True
-            break
-        elif key == ord('c'):
-            e1_frame = e2_frame = e3_frame = e4_frame = e5_frame = e6_frame = e7_frame = e8_frame = None
-            e1_time = e2_time = e3_time = e4_time = e5_time = e6_time = e7_time = e8_time = None
-            annotations.clear()
-
-        if key == ord('a'): key_pressed = 'a'
-        elif key == ord('d'): key_pressed = 'd'
-        elif key == -1: key_pressed = None
-
-        if key_pressed == 'a' and paused:
-            if buf_i > 0:
-                buf_i -= 1
+                buf_i = frame_index
                 audio_player.seek(buf_i / fps)
-        elif key_pressed == 'd' and paused:
-            if buf_i < len(frame_buffer) - 1:
-                buf_i += 1
-                audio_player.seek(buf_i / fps)
-            else:
-                ret, frame = cap.read()
-                if ret:
-                    frame_buffer.append(frame.copy())
+                roi_view = get_zoomed_frame(stream.get(buf_i), 1.0, None, display_video_size)
+                x, y, w, h = cv2.selectROI('Motion ROI', roi_view, showCrosshair=False)
+                cv2.destroyWindow('Motion ROI')
+                dw, dh = display_video_size
+                motion_roi = (x / dw, y / dh, w / dw, h / dh) if w > 0 and h > 0 else None
+                motion_stop.set()
+                motion_stop = threading.Event()
+                motion_future = motion_executor.submit(get_motion_index, mp4_path, stream.path, motion_roi, video_root, motion_stop.is_set)
+                motion_plot = build_motion_image(None, plot_w, motion_h)
+                motion_onsets = []
+                motion_stops = []
+                # Keys typed into the selector are not meant for the annotation window
+                input_queue.clear()
+                break
+            elif key in (ord('+'), ord('=')):  # Zoom audio panel in time
+                _change_audio_zoom(1)
+            elif key == ord('-'):
+                _change_audio_zoom(-1)
+            elif key == ord('1') and not event.ctrl:
+                e1_frame = mark_frame; e1_time = mark_time
+                if e2_frame is not None and e1_frame > e2_frame:
+                    e2_frame = e3_frame = e4_frame = e5_frame = e6_frame = e7_frame = e8_frame = None
+                update_annotations(annotations, 1, (e1_frame, e1_time, audio_sr))
+            elif key == ord('2') and not event.ctrl and e1_frame is not None:
+                e2_frame = mark_frame; e2_time = mark_time
+                if e2_frame < e1_frame:
+                    e2_frame = e3_frame = e4_frame = e5_frame = e6_frame = e7_frame = e8_frame = None
+                update_annotations(annotations, 2, (e2_frame, e2_time, audio_sr))
+            elif key == ord('3') and not event.ctrl and e2_frame is not None:
+                e3_frame = mark_frame; e3_time = mark_time
+                if e3_frame < e2_frame:
+                    e3_frame = e4_frame = e5_frame = e6_frame = e7_frame = e8_frame = None
+                update_annotations(annotations, 3, (e3_frame, e3_time, audio_sr))
+            elif key == ord('4') and not event.ctrl and e3_frame is not None:
+                e4_frame = mark_frame; e4_time = mark_time
+                if e4_frame < e3_frame:
+                    e4_frame = e5_frame = e6_frame = e7_frame = e8_frame = None
+                update_annotations(annotations, 4, (e4_frame, e4_time, audio_sr))
+            elif key == ord('5') and not event.ctrl and e4_frame is not None:
+                e5_frame = mark_frame; e5_time = mark_time
+                if e5_frame < e4_frame:
+                    e5_frame = e6_frame = e7_frame = e8_frame = None
+                update_annotations(annotations, 5, (e5_frame, e5_time, audio_sr))
+            elif key == ord('6') and not event.ctrl and e5_frame is not None:
+                e6_frame = mark_frame; e6_time = mark_time
+                if e6_frame < e5_frame:
+                    e6_frame = e7_frame = e8_frame = None
+                update_annotations(annotations, 6, (e6_frame, e6_time, audio_sr))
+            elif key == ord('7') and not event.ctrl and e6_frame is not None:
+                e7_frame = mark_frame; e7_time = mark_time
+                if e7_frame < e6_frame:
+                    e7_frame = e8_frame = None
+                update_annotations(annotations, 7, (e7_frame, e7_time, audio_sr))
+            elif key == ord('8') and not event.ctrl and e7_frame is not None:
+                e8_frame = mark_frame; e8_time = mark_time
+                if e8_frame < e7_frame:
+                    e8_frame = None
+                update_annotations(annotations, 8, (e8_frame, e8_time, audio_sr))
+
+            elif key == ord('1') and event.ctrl and "1" in video_existing_annotations:
+                print("Restoring event 1 from existing annotations")
+                e1_frame = video_existing_annotations["1"]["frame"]; e1_time = video_existing_annotations["1"]["time"]
+                update_annotations(annotations, 1, (e1_frame, e1_time, audio_sr))
+            elif key == ord('2') and event.ctrl and "2" in video_existing_annotations:
+                e2_frame = video_existing_annotations["2"]["frame"]; e2_time = video_existing_annotations["2"]["time"]
+                update_annotations(annotations, 2, (e2_frame, e2_time, audio_sr))
+            elif key == ord('3') and event.ctrl and "3" in video_existing_annotations:
+                e3_frame = video_existing_annotations["3"]["frame"]; e3_time = video_existing_annotations["3"]["time"]
+                update_annotations(annotations, 3, (e3_frame, e3_time, audio_sr))
+            elif key == ord('4') and event.ctrl and "4" in video_existing_annotations:
+                e4_frame = video_existing_annotations["4"]["frame"]; e4_time = video_existing_annotations["4"]["time"]
+                update_annotations(annotations, 4, (e4_frame, e4_time, audio_sr))
+            elif key == ord('5') and event.ctrl and "5" in video_existing_annotations:
+                e5_frame = video_existing_annotations["5"]["frame"]; e5_time = video_existing_annotations["5"]["time"]
+                update_annotations(annotations, 5, (e5_frame, e5_time, audio_sr))
+            elif key == ord('6') and event.ctrl and "6" in video_existing_annotations:
+                e6_frame = video_existing_annotations["6"]["frame"]; e6_time = video_existing_annotations["6"]["time"]
+                update_annotations(annotations, 6, (e6_frame, e6_time, audio_sr))
+            elif key == ord('7') and event.ctrl and "7" in video_existing_annotations:
+                e7_frame = video_existing_annotations["7"]["frame"]; e7_time = video_existing_annotations["7"]["time"]
+                update_annotations(annotations, 7, (e7_frame, e7_time, audio_sr))
+            elif key == ord('8') and event.ctrl and "8" in video_existing_annotations:
+                e8_frame = video_existing_annotations["8"]["frame"]; e8_time = video_existing_annotations["8"]["time"]
+                update_annotations(annotations, 8, (e8_frame, e8_time, audio_sr))
+            elif key == ord('n'):
+                leave = True
+                break
+            elif key == ord('p'):
+                go_prev = True
+                leave = True
+                break
+            elif key == ord('a') and paused:
+                if buf_i > 0:
+                    buf_i -= 1
+                    audio_player.seek(buf_i / fps)
+            elif key == ord('d') and paused:
+                if stream.get(buf_i + 1) is not None:
                     buf_i += 1
                     audio_player.seek(buf_i / fps)
-                else:
-                    paused = True
+            elif key == ord('c'):
+                e1_frame = e2_frame = e3_frame = e4_frame = e5_frame = e6_frame = e7_frame = e8_frame = None
+                e1_time = e2_time = e3_time = e4_time = e5_time = e6_time = e7_time = e8_time = None
+                annotations.clear()
 
-    audio_player.stop()
+        if leave:
+            break
 
-    cap.release()
+    audio_player.stop()
+    if audio_tiles is not None:
+        audio_tiles.close()
+
+    motion_stop.set()
+    motion_executor.shutdown(wait=False, cancel_futures=True)
+    stream.close()
+    if full is not None:
+        full.close()
+    camera_sync = None
+    if secondary is not None:
+        # One annotation action is recorded for both cameras
+        for v in annotations.values():
+            if v["frame"] is not None and v["time"] is not None:
+                v["frames"] = {
+                    os.path.basename(video_path): v["frame"],
+                    os.path.basename(secondary_video_path): camera_frame_index(secondary, v["time"], camera_offset),
+                }
+        camera_sync = {
+            "video_files": [os.path.basename(video_path), os.path.basename(secondary_video_path)],
+            "offset": camera_offset,
+        }
+        secondary.close()
+    if secondary_full is not None:
+        secondary_full.close()
     cv2.destroyAllWindows()
 
     if annotations:
-        should_update_audio = False
-        if audio_path is not None and os.path.exists(audio_path):
-            should_update_audio = durations_match(total_frames, audio_sr, audio_data)
-        merge_annotations(video_path, annotations, audio_path, should_update_audio)
+        if sync_future is not None:
+            try:
+                audio_sync = sync_future.result()
+            except Exception as e:
+                print(f"Error estimating audio offset for {video_path}: {e}")
+        save_video_annotations(video_path, annotations, audio_path, audio_sr, audio_sync, camera_sync, video_root)
     else:
         print(f"No annotations made for {video_path}.")
+    sync_executor.shutdown(wait=False, cancel_futures=True)
 
     if mp4_path != video_path:
         os.remove(mp4_path)
@@ -805,19 +950,128 @@ def annotate_video(video_path, audio_path, labelled_position_path, audio_channel
         return 'next'
 
 
+def _candidates_job(paths):
+    video_file_path, audio_file_path, labelled_position_file_path, video_root = paths
+    try:
+        candidates = get_event_candidates(video_file_path, audio_file_path, labelled_position_file_path, video_root=video_root)
+        return video_file_path, len(candidates), None
+    except Exception as e:
+        return video_file_path, 0, e
+
+def compute_candidates_in_folder(video_path, audio_path, labelled_position_path, workers=None):
+    audio_files = index_files(audio_path, ('.wav',))
+    csv_files = index_files(labelled_position_path, ('.csv',))
+    jobs = ((
+        os.path.join(video_path, video_file),
+        match_file(audio_files, video_file),
+        match_file(csv_files, video_file),
+        video_path,
+    ) for video_file in list_videos(video_path))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for video_file_path, count, error in executor.map(_candidates_job, jobs):
+            if error is not None:
+                print(f"Error detecting candidates for {video_file_path}: {error}")
+            else:
+                print(f"{count} candidates for {video_file_path}")
+
+def pair_camera_videos(videos):
+    # Videos arrive folder by folder, so the cameras of a recording are complete once their folder is done
+    for _, folder_videos in itertools.groupby(videos, key=os.path.dirname):
+        groups = {}
+        for video_file in folder_videos:
+            groups.setdefault(get_json_key(video_file), []).append(video_file)
+
+        for group in groups.values():
+            if len(group) > 2:
+                print(f"Only two cameras are shown side by side, {group[0]} is annotated with {group[1]} and "
+                      f"{', '.join(group[2:])} is skipped.")
+            yield group[0], group[1] if len(group) > 1 else None
+
+def _sync_job(paths):
+    video_file_path, audio_file_path, json_path = paths
+    try:
+        audio_sr, audio_data = read_wave(audio_file_path)
+        cap = cv2.VideoCapture(video_file_path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        audio_sync = estimate_av_sync(video_file_path, audio_data, audio_sr, fps, total_frames)
+        if audio_sync is not None:
+            write_audio_sync(json_path, os.path.basename(video_file_path), os.path.basename(audio_file_path), audio_sr, audio_sync)
+        return video_file_path, audio_sync, None
+    except Exception as e:
+        return video_file_path, None, e
+
+def sync_videos_in_folder(video_path, audio_path, workers=None):
+    audio_files = index_files(audio_path, ('.wav',))
+
+    def jobs():
+        measured = set()
+        for video_file in list_videos(video_path):
+            video_file_path = os.path.join(video_path, video_file)
+            audio_file_path = match_file(audio_files, video_file)
+            json_path = get_json_path(video_file_path, video_path)
+            # cam1/cam2 share one JSON, only the first camera is measured
+            if audio_file_path and json_path not in measured:
+                measured.add(json_path)
+                yield video_file_path, audio_file_path, json_path
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for video_file_path, audio_sync, error in executor.map(_sync_job, jobs()):
+            if error is not None:
+                print(f"Error estimating audio offset for {video_file_path}: {error}")
+            elif audio_sync is None:
+                print(f"{video_file_path}: audio does not match the video, skipped")
+            else:
+                print(f"{video_file_path}: offset {audio_sync['offset']:.4f}s, drift {audio_sync['drift']:.2e} ({audio_sync['method']})")
+
+def process_videos_in_folder(video_path, audio_path, labelled_position_path, audio_channel, multi_camera=False, camera_offset=None,
+                             only_missing=None, resume=False, history_codec='jpg', proxy=False):
 
-def process_videos_in_folder(video_path, audio_path, labelled_position_path, audio_channel):
+    videos = list_videos(video_path)
+    audio_files = index_files(audio_path, ('.wav',))
+    csv_files = index_files(labelled_position_path, ('.csv',))
+    if multi_camera:
+        units = pair_camera_videos(videos)
+    else:
+        units = ((video_file, None) for video_file in videos)
 
-    videos = sorted([f for f in os.listdir(video_path) if f.lower().endswith(('.mp4', '.webm'))])
+    annotation_index = build_annotation_index(get_annotations_folder(None, video_path))
+    complete = sum(1 for events in annotation_index.values() if all(event in events for event in REQUIRED_EVENTS))
+    print(f"{len(annotation_index)} annotation files, {complete} with events {', '.join('E' + e for e in REQUIRED_EVENTS)} annotated.")
 
+    if only_missing:
+        print(f"Only opening videos missing {', '.join('E' + e for e in only_missing)}.")
+        units = (unit for unit in units if missing_events(annotation_index, unit[0], only_missing))
+
+    # Videos are taken from the scan as they are reached, the visited ones are kept for going back
+    units = iter(units)
+    visited = []
     i = 0
-    while 0 <= i < len(videos):
-        video_file = videos[i]
-        file_basename, ext = os.path.splitext(video_file)
-        video_file_path = os.path.join(video_path, file_basename + ext)
-        audio_file_path = os.path.join(audio_path, file_basename + '.wav') if audio_path else None
-        labelled_position_file_path = os.path.join(labelled_position_path, file_basename + '.csv') if labelled_position_path else None
-        result = annotate_video(video_file_path, audio_file_path, labelled_position_file_path, audio_channel)
+    if resume:
+        for unit in units:
+            visited.append(unit)
+            if missing_events(annotation_index, unit[0]):
+                i = len(visited) - 1
+                break
+        else:
+            print(f"All videos have events {', '.join('E' + e for e in REQUIRED_EVENTS)} annotated, nothing left to resume.")
+            return
+
+    while i >= 0:
+        if i == len(visited):
+            unit = next(units, None)
+            if unit is None:
+                break
+            visited.append(unit)
+        video_file, secondary_file = visited[i]
+        video_file_path = os.path.join(video_path, video_file)
+        secondary_file_path = os.path.join(video_path, secondary_file) if secondary_file else None
+        audio_file_path = match_file(audio_files, video_file)
+        labelled_position_file_path = match_file(csv_files, video_file)
+        result = annotate_video(video_file_path, audio_file_path, labelled_position_file_path, audio_channel,
+                                secondary_file_path, camera_offset, video_path, history_codec, proxy)
         if result == 'quit':
             break
         elif result == 'prev':
@@ -825,13 +1079,68 @@ def process_videos_in_folder(video_path, audio_path, labelled_position_path, aud
         else:
             i += 1
 
+    # Unfinished proxies are discarded and built again next time
+    proxy_stop.set()
+    proxy_executor.shutdown(wait=True, cancel_futures=True)
+
+def _add_folder_arguments(parser, default=None):
+    parser.add_argument('--video-path', type=str, default=default, help='Path to the folder containing video files')
+    parser.add_argument('--audio-path', type=str, default=default, help='Path to the folder containing audio files')
+    parser.add_argument('--velocity-path', type=str, default=default, help='Path to the folder containing velocity files')
+
+def _event_number(value):
+    event = value.upper().lstrip('E')
+    if event not in ('1', '2', '3', '4', '5', '6', '7', '8'):
+        raise argparse.ArgumentTypeError(f"invalid event {value!r}, expected E1-E8")
+    return event
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Annotate time instants in videos in a folder.')
-    parser.add_argument('--video-path', type=str, help='Path to the folder containing video files')
-    parser.add_argument('--audio-path', type=str, help='Path to the folder containing audio files')
-    parser.add_argument('--velocity-path', type=str, help='Path to the folder containing velocity files')
+    _add_folder_arguments(parser)
     parser.add_argument('--audio-channel', type=int, default=0, help='Audio channel to use for waveform (default: 0)')
-    return parser.parse_args()
+    parser.add_argument('--multi-camera', action='store_true', help='Annotate cam1/cam2 pairs side by side with one shared clock')
+    parser.add_argument('--camera-offset', type=float, default=None, help='Start offset of cam2 relative to cam1 in seconds (default: from the audio tracks or creation times)')
+    parser.add_argument('--only-missing', nargs='+', type=_event_number, default=None, metavar='EVENT',
+                        help='Only open videos missing any of these events, e.g. --only-missing E4')
+    parser.add_argument('--resume', action='store_true', help=f'Start at the first video without all of E1-E{REQUIRED_EVENTS[-1]} annotated')
+    parser.add_argument('--history-codec', choices=HISTORY_CODECS, default='jpg',
+                        help='Compression of decoded frames kept for stepping back, png is lossless (default: jpg)')
+    parser.add_argument('--proxy', action='store_true', help=f'Navigate on cached all-intra {PROXY_HEIGHT}p proxies, original frames are shown when zoomed in')
+
+    # Subcommand defaults are suppressed so they do not override options given before the subcommand
+    subparsers = parser.add_subparsers(dest='command')
+    candidates_parser = subparsers.add_parser('candidates', help='Precompute event candidates for all videos in a folder')
+    _add_folder_arguments(candidates_parser, default=argparse.SUPPRESS)
+    candidates_parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: CPU count)')
+
+    sync_parser = subparsers.add_parser('sync', help='Estimate audio/video offset and drift for all videos in a folder')
+    sync_parser.add_argument('--video-path', type=str, default=argparse.SUPPRESS, help='Path to the folder containing video files')
+    sync_parser.add_argument('--audio-path', type=str, default=argparse.SUPPRESS, help='Path to the folder containing audio files')
+    sync_parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: CPU count)')
+
+    export_parser = subparsers.add_parser('export', help='Export all annotations into one CSV/Parquet/NPZ file')
+    export_parser.add_argument('--video-path', type=str, default=argparse.SUPPRESS, help='Path to the folder containing video files')
+    export_parser.add_argument('--annotations-path', type=str, default=None, help='Path to the annotations folder (default: next to the video folder)')
+    export_parser.add_argument('--output', type=str, required=True, help='Output file, the format is taken from the extension (.csv, .parquet, .npz)')
+    export_parser.add_argument('--workers', type=int, default=None, help='Number of loader threads')
+
+    serve_parser = subparsers.add_parser('serve', help='Annotate in the browser through a local HTTP server')
+    _add_folder_arguments(serve_parser, default=argparse.SUPPRESS)
+    serve_parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+    serve_parser.add_argument('--workers', type=int, default=None, help='Number of JPEG encoder threads')
+
+    render_parser = subparsers.add_parser('render', help='Render review videos with the audio/velocity panels and event markers')
+    _add_folder_arguments(render_parser, default=argparse.SUPPRESS)
+    render_parser.add_argument('--output', type=str, required=True, help='Folder for the rendered <video>_review.mp4 files')
+    render_parser.add_argument('--audio-channel', type=int, default=argparse.SUPPRESS, help='Audio channel to show and mix in (default: 0)')
+    render_parser.add_argument('--panel', choices=('waveform', 'spectrogram'), default='spectrogram', help='Audio panel to show (default: spectrogram)')
+    render_parser.add_argument('--width', type=int, default=1280, help='Width of the rendered video (default: 1280)')
+    render_parser.add_argument('--chunk-seconds', type=float, default=30.0, help='Length of the chunks rendered in parallel (default: 30)')
+    render_parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: CPU count)')
+    args = parser.parse_args()
+    if args.command == 'export' and args.video_path is None and args.annotations_path is None:
+        export_parser.error('one of --video-path or --annotations-path is required')
+    return args
 
 def main():
 
@@ -842,11 +1151,33 @@ def main():
     labelled_position_path = args.velocity_path
     audio_channel = args.audio_channel
 
+    if args.command == 'candidates':
+        compute_candidates_in_folder(video_path, audio_path, labelled_position_path, args.workers)
+        return
+    if args.command == 'sync':
+        sync_videos_in_folder(video_path, audio_path, args.workers)
+        return
+    if args.command == 'export':
+        annotations_path = args.annotations_path or get_annotations_folder(None, video_path)
+        try:
+            export_annotations(annotations_path, args.output, args.workers)
+        except ValueError as e:
+            export_parser.error(str(e))
+        return
+    if args.command == 'serve':
+        serve_folder(video_path, audio_path, labelled_position_path, port=args.port, workers=args.workers)
+        return
+    if args.command == 'render':
+        render_reviews_in_folder(video_path, audio_path, labelled_position_path, args.output, audio_channel, args.panel,
+                                 args.workers, args.chunk_seconds, args.width)
+        return
+
     keyboard_listener = keyboard.Listener(on_press=_on_press, on_release=_on_release)
     keyboard_listener.daemon = True
     keyboard_listener.start()
 
-    process_videos_in_folder(video_path, audio_path, labelled_position_path, audio_channel)
+    process_videos_in_folder(video_path, audio_path, labelled_position_path, audio_channel, args.multi_camera, args.camera_offset,
+                             args.only_missing, args.resume, args.history_codec, args.proxy)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,136 @@
+import threading
+import cv2
+
+from video_annotation_tool.frame_history import HOT_FRAMES, MEMORY_LIMIT_MB, FrameHistory
+
+
+class VideoStream:
+    """Decodes a video on a background thread and keeps the decoded frames, compressed, for random access."""
+
+    def __init__(self, path, read_ahead=30, history_codec='jpg', memory_limit_mb=MEMORY_LIMIT_MB, seekable=False):
+        self.path = path
+        self._cap = cv2.VideoCapture(path)
+        self._seek_cap = None
+        self._seek_lock = threading.Lock()
+        self._read_ahead = read_ahead
+        # Seeking is only cheap on all-intra files such as proxies, elsewhere the decoder reads through
+        self._seekable = seekable
+        self._history = FrameHistory(history_codec, read_ahead=read_ahead, memory_limit_mb=memory_limit_mb)
+        self._decoded = 0
+        self._wanted = 0
+        self._eof = False
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+        if not self._cap.isOpened():
+            return
+
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 30
+        self.frame_count = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.size = (int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+        self._thread = threading.Thread(target=self._run, name=f'decode-{path}', daemon=True)
+        self._thread.start()
+
+    def is_opened(self):
+        return self._thread is not None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and self._decoded > self._wanted + self._read_ahead:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                seek_to = None
+                if self._seekable and self._wanted > self._decoded + 2 * self._read_ahead:
+                    # Frames skipped here are decoded on demand by _reread
+                    self._decoded = seek_to = self._wanted
+
+            if seek_to is not None:
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, seek_to)
+            ret, frame = self._cap.read()
+
+            with self._cond:
+                if not ret:
+                    self._eof = True
+                    self._cond.notify_all()
+                    return
+                self._history.add(self._decoded, frame)
+                self._decoded += 1
+                self._cond.notify_all()
+
+    def get(self, index):
+        """Return frame `index`, waiting for the decoder if needed, or None past the end of the video."""
+        if index < 0 or self._thread is None:
+            return None
+        with self._cond:
+            if index > self._wanted:
+                self._wanted = index
+                self._cond.notify_all()
+            while self._decoded <= index and not self._eof and not self._stopped:
+                self._cond.wait()
+            if index >= self._decoded:
+                return None
+        frame = self._history.get(index)
+        if frame is None:
+            frame = self._reread(index)
+        return frame
+
+    def _reread(self, index):
+        # The frame was dropped from the history, decode it again together with the frames just before it
+        with self._seek_lock:
+            if self._seek_cap is None:
+                self._seek_cap = cv2.VideoCapture(self.path)
+            start = max(0, index - HOT_FRAMES)
+            self._seek_cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            frame = None
+            for i in range(start, index + 1):
+                ret, frame = self._seek_cap.read()
+                if not ret:
+                    return None
+                self._history.add(i, frame)
+        return self._history.get(index)
+
+    def last_index(self, index):
+        """Clamp `index` to the frames available, decoding up to it first."""
+        self.get(index)
+        with self._cond:
+            return max(0, min(index, self._decoded - 1))
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+        self._history.close()
+        self._cap.release()
+        if self._seek_cap is not None:
+            self._seek_cap.release()
+
+
+class FrameReader:
+    """Reads single frames of a video by index, seeking only when they are not consecutive."""
+
+    def __init__(self, path):
+        self._cap = cv2.VideoCapture(path)
+        self.size = (int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self._next = 0
+        self._last_index = None
+        self._last_frame = None
+
+    def get(self, index, default=None):
+        if index == self._last_index:
+            return self._last_frame
+        if index != self._next:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, frame = self._cap.read()
+        self._next = index + 1 if ret else -1
+        self._last_index = index if ret else None
+        self._last_frame = frame if ret else None
+        return frame if ret else default
+
+    def close(self):
+        self._cap.release()